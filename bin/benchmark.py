@@ -0,0 +1,280 @@
+'''Benchmark data generation stages at different scales.
+
+Each stage runs in a fresh process so that its peak memory does not
+include the peaks of earlier stages or presets, and does what the
+corresponding script does: load its inputs from the previous stage's
+files, generate, and save.  Stages are repeated and the fastest run is
+kept so that scheduling noise is not reported as a regression.
+'''
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+
+import pandas as pd
+
+import make_assays
+import make_db
+import make_genomes
+import make_plates
+import make_samples
+from params import AssayParams, GenomeParams, SampleParams, load_params
+
+# Number of individuals for each preset.
+PRESETS = {
+    'tiny': 10**3,
+    'small': 10**4,
+    'medium': 10**5,
+    'large': 10**6,
+    'huge': 10**7,
+}
+
+# Phases of a stage timed separately (their sum is the stage's seconds).
+PHASES = ('load', 'generate', 'save')
+
+# Measurements compared against the baseline.
+METRICS = ('seconds', 'peak_bytes', 'output_bytes')
+
+# Allowed fractional increase before a measurement counts as a regression.
+TOLERANCE = 0.25
+
+# Smallest absolute increase that counts as a regression, so that small
+# stages are not flagged for noise that is large relative to their size.
+MIN_DELTA = {'seconds': 0.25, 'peak_bytes': 16 * 2**20, 'output_bytes': 0}
+
+# Number of times each stage is run (the fastest run is reported).
+REPEAT = 3
+
+
+def main():
+    '''Main driver.'''
+    options = parse_args()
+    results = {
+        'memory': options.memory,
+        'repeat': options.repeat,
+        'presets': {name: run_preset(options, name) for name in options.presets},
+    }
+    as_text = json.dumps(results, indent=4)
+    if options.outfile:
+        Path(options.outfile).write_text(as_text)
+    else:
+        print(as_text)
+    if options.baseline:
+        if not Path(options.baseline).exists():
+            print(
+                f'no baseline {options.baseline}: record one with "make bench-baseline"',
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        baseline = json.loads(Path(options.baseline).read_text())
+        regressions = compare(baseline, results, options.tolerance)
+        for line in regressions:
+            print(line, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+def compare(baseline, results, tolerance):
+    '''Report measurements that are worse than the baseline.'''
+    regressions = []
+    for preset, stages in results['presets'].items():
+        for stage, current in stages.items():
+            previous = baseline['presets'].get(preset, {}).get(stage)
+            if previous is None:
+                continue
+            for metric in METRICS:
+                limit = max(previous[metric] * (1 + tolerance), previous[metric] + MIN_DELTA[metric])
+                if current[metric] > limit:
+                    regressions.append(
+                        f'{preset}/{stage}/{metric}: {previous[metric]} => {current[metric]}'
+                    )
+    return regressions
+
+
+def measure(options, func, *args):
+    '''Run a stage repeatedly in fresh processes and keep the fastest run and lowest peak memory.'''
+    context = multiprocessing.get_context('spawn')
+    runs = []
+    for _ in range(options.repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            runs.append(executor.submit(_run_stage, options.memory, func, *args).result())
+    fastest = min(runs, key=lambda run: run['seconds'])
+    return {**fastest, 'peak_bytes': min(run['peak_bytes'] for run in runs)}
+
+
+def run_preset(options, name):
+    '''Run all stages for one preset.'''
+    genome_params = replace(options.genome_params, num_genomes=PRESETS[name])
+    stats = {}
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        outputs = {
+            'genomes': Path(temp_dir, 'genome_data.json'),
+            'samples': Path(temp_dir, 'sample_data.csv'),
+            'assays': Path(temp_dir, 'assay_data.json'),
+            'designs': Path(temp_dir, 'designs'),
+            'readings': Path(temp_dir, 'readings'),
+            'db': Path(temp_dir, 'lab.db'),
+        }
+        outputs['designs'].mkdir()
+        outputs['readings'].mkdir()
+
+        stats['genomes'] = measure(options, _genomes_stage, genome_params, outputs)
+        stats['genomes']['output_bytes'] = _size(outputs['genomes'])
+
+        stats['samples'] = measure(
+            options, _samples_stage, options.sample_params, options.sites, options.surveys, outputs
+        )
+        stats['samples']['output_bytes'] = _size(outputs['samples'])
+
+        stats['assays'] = measure(options, _assays_stage, options.assay_params, outputs)
+        stats['assays']['output_bytes'] = _size(outputs['assays'])
+
+        stats['plates'] = measure(options, _plates_stage, options.assay_params, outputs)
+        stats['plates']['output_bytes'] = _size(outputs['designs']) + _size(outputs['readings'])
+
+        stats['db'] = measure(options, _db_stage, options.sites, options.surveys, outputs)
+        stats['db']['output_bytes'] = _size(outputs['db'])
+
+    return stats
+
+
+def parse_args():
+    '''Parse command-line arguments.'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--assay-params', type=str, required=True, help='assay parameter file')
+    parser.add_argument('--baseline', type=str, default=None, help='previous results to compare against')
+    parser.add_argument('--genome-params', type=str, required=True, help='genome parameter file')
+    parser.add_argument('--memory', choices=('rss', 'tracemalloc'), default='rss', help='how to measure peak memory')
+    parser.add_argument('--outfile', type=str, default=None, help='results file')
+    parser.add_argument('--presets', nargs='+', choices=PRESETS.keys(), default=['tiny'], help='scales to run')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='runs per stage (fastest is kept)')
+    parser.add_argument('--sample-params', type=str, required=True, help='sample parameter file')
+    parser.add_argument('--sites', type=str, required=True, help='sites parameter file')
+    parser.add_argument('--surveys', type=str, required=True, help='surveys parameter file')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='allowed fractional slowdown')
+    options = parser.parse_args()
+    options.assay_params = load_params(AssayParams, options.assay_params)
+    options.genome_params = load_params(GenomeParams, options.genome_params)
+    options.sample_params = load_params(SampleParams, options.sample_params)
+    return options
+
+
+def _run_stage(memory, func, *args):
+    '''Run one stage, measuring time and peak memory in this process only.'''
+    if memory == 'tracemalloc':
+        tracemalloc.start()
+    seconds = dict.fromkeys(PHASES, 0.0)
+    func(seconds, *args)
+    if memory == 'tracemalloc':
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    else:
+        peak = _max_rss()
+    return {
+        'seconds': sum(seconds.values()),
+        **{f'{name}_seconds': value for name, value in seconds.items()},
+        'peak_bytes': peak,
+    }
+
+
+def _genomes_stage(seconds, params, outputs):
+    '''Generate and save genomes as make_genomes does.'''
+    with _phase(seconds, 'generate'):
+        genomes = make_genomes.generate_genomes(params)
+    with _phase(seconds, 'save'):
+        make_genomes.save(outputs['genomes'], genomes)
+
+
+def _samples_stage(seconds, params, sites, surveys, outputs):
+    '''Load genomes, then generate and save samples as make_samples does.'''
+    with _phase(seconds, 'load'):
+        genomes = json.loads(outputs['genomes'].read_text())
+        geo_params = make_samples.get_geo_params(pd.read_csv(sites), pd.read_csv(surveys))
+    with _phase(seconds, 'generate'):
+        samples = make_samples.generate_samples(params, genomes, geo_params)
+    with _phase(seconds, 'save'):
+        make_samples.save(outputs['samples'], samples)
+
+
+def _assays_stage(seconds, params, outputs):
+    '''Load genomes and samples, then generate and save assays as make_assays does.'''
+    with _phase(seconds, 'load'):
+        genomes = json.loads(outputs['genomes'].read_text())
+        samples = pd.read_csv(outputs['samples'])
+    with _phase(seconds, 'generate'):
+        result = make_assays.generate_assays(params, genomes, samples)
+    with _phase(seconds, 'save'):
+        make_assays.save(outputs['assays'], result)
+
+
+def _plates_stage(seconds, params, outputs):
+    '''Load assays, then create plate files as make_plates does.'''
+    for path in [*outputs['designs'].iterdir(), *outputs['readings'].iterdir()]:
+        path.unlink()
+    with _phase(seconds, 'load'):
+        assays = json.loads(outputs['assays'].read_text())
+    with _phase(seconds, 'generate'):
+        make_plates.create_files(params, assays, outputs['designs'], outputs['readings'])
+
+
+def _db_stage(seconds, sites, surveys, outputs):
+    '''Load all data files, then write the database as make_db does.'''
+    with _phase(seconds, 'load'):
+        assays = json.loads(outputs['assays'].read_text())
+        samples = make_db.read_csv(outputs['samples'])
+        sites = make_db.read_csv(sites)
+        surveys = make_db.read_csv(surveys, *make_db.SURVEY_COLUMNS)
+        genomes = json.loads(outputs['genomes'].read_text())
+    with _phase(seconds, 'save'):
+        outputs['db'].unlink(missing_ok=True)
+        con = sqlite3.connect(outputs['db'])
+        make_db.tables_to_db(con, samples, sites, surveys, assays, genomes)
+        con.close()
+
+
+def _max_rss():
+    '''Peak resident set size of this process so far in bytes.
+
+    Linux carries ru_maxrss across exec (so a spawned process would report
+    its parent's peak), so use the high-water mark of this process's own
+    memory map there instead.
+    '''
+    status = Path('/proc/self/status')
+    if status.exists():
+        for line in status.read_text().splitlines():
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    kilobytes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kilobytes * 1024 if sys.platform != 'darwin' else kilobytes
+
+
+@contextlib.contextmanager
+def _phase(seconds, name):
+    '''Add the time spent in a block to a phase's total.'''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds[name] += time.perf_counter() - start
+
+
+def _size(path):
+    '''Total size of a file or the files in a directory.'''
+    if path.is_dir():
+        return sum(p.stat().st_size for p in path.iterdir() if p.is_file())
+    return path.stat().st_size
+
+
+if __name__ == '__main__':
+    main()
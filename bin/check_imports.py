@@ -0,0 +1,75 @@
+'''Check that generation scripts start without loading heavy packages.
+
+Import times are printed for information only: they vary by machine and
+from run to run, so they only fail the check if `--budget` is given.
+'''
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+# Packages that must only be imported on the code paths that use them.
+HEAVY = {'faker', 'geopy', 'numpy', 'pandas', 'sqlalchemy'}
+
+# Scripts to check by default.
+SCRIPTS = [
+    'make_all.py',
+    'make_assays.py',
+    'make_db.py',
+    'make_genomes.py',
+    'make_plates.py',
+    'make_samples.py',
+]
+
+
+def main():
+    '''Main driver.'''
+    options = parse_args()
+    problems = []
+    for script in options.scripts:
+        modules = import_times(script)
+        heavy = sorted({name.split('.')[0] for name in modules} & HEAVY)
+        total = sum(modules.values()) / 1000
+        print(f'{script}: {total:.1f} ms')
+        if heavy:
+            problems.append(f'{script} imports {", ".join(heavy)} at startup')
+        if (options.budget is not None) and (total > options.budget):
+            problems.append(f'{script} import time {total:.1f} ms exceeds {options.budget} ms')
+    for line in problems:
+        print(line, file=sys.stderr)
+    if problems:
+        sys.exit(1)
+
+
+def import_times(script):
+    '''Get self import time in microseconds for each module loaded by `script --help`.'''
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', script, '--help'],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        if self_us.strip().isdigit():
+            modules[name.strip()] = int(self_us)
+    return modules
+
+
+def parse_args():
+    '''Parse command-line arguments.'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--budget', type=float, default=None, help='optional import time limit (ms)')
+    parser.add_argument('scripts', nargs='*', help='scripts to check')
+    options = parser.parse_args()
+    if not options.scripts:
+        options.scripts = [str(Path(__file__).parent / s) for s in SCRIPTS]
+    return options
+
+
+if __name__ == '__main__':
+    main()
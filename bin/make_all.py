@@ -0,0 +1,89 @@
+'''Run the whole data-generation pipeline in a single process.'''
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import make_assays
+import make_db
+import make_genomes
+import make_plates
+import make_samples
+from params import AssayParams, GenomeParams, SampleParams, load_params
+from profiling import add_profile_args, phase, profile
+
+
+def main():
+    '''Main driver.'''
+    with phase('load params'):
+        options = parse_args()
+    with profile(options.profile):
+        run_pipeline(options)
+
+
+def run_pipeline(options):
+    '''Generate all datasets, passing data between stages in memory.'''
+    import pandas as pd
+    with ThreadPoolExecutor() as pool:
+        pending = []
+
+        pool_of_genes = make_genomes.generate_genomes(options.genome_params)
+        if options.genomes:
+            pending.append(pool.submit(make_genomes.save, options.genomes, pool_of_genes))
+        genomes = vars(pool_of_genes)
+
+        sites = pd.read_csv(options.sites)
+        surveys = pd.read_csv(options.surveys)
+        geo_params = make_samples.get_geo_params(sites, surveys)
+        samples = make_samples.generate_samples(options.sample_params, genomes, geo_params)
+        if options.samples:
+            pending.append(pool.submit(make_samples.save, options.samples, samples))
+
+        assays = make_assays.generate_assays(options.assay_params, genomes, samples)
+        if options.assays:
+            pending.append(pool.submit(make_assays.save, options.assays, assays))
+
+        # Plates and database only depend on data generated above.
+        Path(options.designs).mkdir(parents=True, exist_ok=True)
+        Path(options.readings).mkdir(parents=True, exist_ok=True)
+        pending.append(
+            pool.submit(
+                make_plates.create_files,
+                options.assay_params,
+                assays,
+                options.designs,
+                options.readings,
+            )
+        )
+        pending.append(
+            pool.submit(make_db.create_db, options.dbfile, samples, sites, surveys, assays, genomes)
+        )
+
+        for future in pending:
+            future.result()
+
+
+def parse_args():
+    '''Parse command-line arguments.'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--assay-params', type=str, required=True, help='assay parameter file')
+    parser.add_argument('--assays', type=str, default=None, help='optional assay data file')
+    parser.add_argument('--dbfile', type=str, required=True, help='output database file')
+    parser.add_argument('--designs', type=str, required=True, help='designs directory')
+    parser.add_argument('--genome-params', type=str, required=True, help='genome parameter file')
+    parser.add_argument('--genomes', type=str, default=None, help='optional genome data file')
+    parser.add_argument('--readings', type=str, required=True, help='readings directory')
+    parser.add_argument('--sample-params', type=str, required=True, help='sample parameter file')
+    parser.add_argument('--samples', type=str, default=None, help='optional samples data file')
+    parser.add_argument('--sites', type=str, required=True, help='sites parameter file')
+    parser.add_argument('--surveys', type=str, required=True, help='surveys parameter file')
+    add_profile_args(parser)
+    options = parser.parse_args()
+    options.assay_params = load_params(AssayParams, options.assay_params)
+    options.genome_params = load_params(GenomeParams, options.genome_params)
+    options.sample_params = load_params(SampleParams, options.sample_params)
+    return options
+
+
+if __name__ == '__main__':
+    main()
@@ -3,14 +3,12 @@
 import argparse
 from datetime import date, datetime, timedelta
 import json
-import pandas as pd
 from pathlib import Path
 import random
 import string
 
-from faker import Faker
-
 from params import AssayParams, load_params
+from profiling import add_profile_args, phase, profile, timed
 
 
 class DateTimeEncoder(json.JSONEncoder):
@@ -21,17 +19,31 @@ class DateTimeEncoder(json.JSONEncoder):
 
 def main():
     '''Main driver.'''
-    options = parse_args()
-    individuals = make_individuals(options)
-    random.seed(options.params.seed)
-    fake = Faker(options.params.locale)
-    result = {
-        'staff': make_staff(options.params, fake),
-        **make_experiments(options.params, fake, individuals)
+    with phase('load params'):
+        options = parse_args()
+    with profile(options.profile):
+        with phase('load data'):
+            import pandas as pd
+            genomes = json.loads(Path(options.genomes).read_text())
+            samples = pd.read_csv(options.samples)
+        with phase('generate'):
+            result = generate_assays(options.params, genomes, samples)
+        save(options.outfile, result)
+
+
+def generate_assays(params, genomes, samples):
+    '''Generate staff, experiments, and plates for samples.'''
+    from faker import Faker
+    individuals = make_individuals(genomes, samples)
+    random.seed(params.seed)
+    fake = Faker(params.locale)
+    return {
+        'staff': make_staff(params, fake),
+        **make_experiments(params, fake, individuals)
     }
-    save(options.outfile, result)
 
 
+@timed
 def make_experiments(params, fake, individuals):
     '''Create experiments and their data.'''
     kinds = list(params.experiments.keys())
@@ -70,15 +82,15 @@ def make_experiments(params, fake, individuals):
     }
 
 
-def make_individuals(options):
+@timed
+def make_individuals(genomes, samples):
     '''Re-create individual genomic information.'''
-    genomes = json.loads(Path(options.genomes).read_text())
-    samples = pd.read_csv(options.samples)
     susceptible_loc = genomes['susceptible_loc']
     susceptible_base = genomes['susceptible_base']
     return [g[susceptible_loc] == susceptible_base for g in samples['sequence']]
 
 
+@timed
 def make_staff(params, fake):
     '''Create people.'''
     return [
@@ -87,6 +99,7 @@ def make_staff(params, fake):
     ]
 
 
+@timed
 def invalidate_plates(params, plates):
     '''Invalidate a random set of plates.'''
     selected = [
@@ -121,6 +134,7 @@ def parse_args():
     parser.add_argument('--outfile', type=str, default=None, help='output file')
     parser.add_argument('--params', type=str, required=True, help='parameter file')
     parser.add_argument('--samples', type=str, required=True, help='samples file')
+    add_profile_args(parser)
     options = parser.parse_args()
     assert options.params != options.outfile, 'Cannot use same filename for options and parameters'
     options.params = load_params(AssayParams, options.params)
@@ -166,11 +180,13 @@ def round_date(raw):
 
 def save(outfile, result):
     '''Save or show generated data.'''
-    as_text = json.dumps(result, indent=4, cls=DateTimeEncoder)
-    if outfile:
-        Path(outfile).write_text(as_text)
-    else:
-        print(as_text)
+    with phase('serialize'):
+        as_text = json.dumps(result, indent=4, cls=DateTimeEncoder)
+    with phase('write'):
+        if outfile:
+            Path(outfile).write_text(as_text)
+        else:
+            print(as_text)
 
 
 if __name__ == '__main__':
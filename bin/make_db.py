@@ -1,40 +1,315 @@
 '''Generate database from data files.'''
 
 import argparse
+import csv
 import json
-import pandas as pd
+import math
 import sqlite3
+import zlib
+from datetime import UTC, date, datetime
+from pathlib import Path
+from uuid import uuid4
+
+from profiling import add_profile_args, phase, profile, timed
+
+# Tables created from assay data.
+ASSAY_TABLES = ('staff', 'experiment', 'performed', 'plate', 'invalidated')
+
+# Columns kept from survey parameters.
+SURVEY_COLUMNS = ('survey_id', 'site_id', 'date')
+
+# Primary keys (performed and invalidated use SQLite's rowid).
+PRIMARY_KEYS = {
+    'sample': 'sample_id',
+    'site': 'site_id',
+    'survey': 'survey_id',
+    'staff': 'staff_id',
+    'experiment': 'sample_id',
+    'plate': 'plate_id',
+}
+
+# Other columns used to filter or join.
+INDEXES = {
+    'sample': ('survey_id', 'reading'),
+    'survey': ('site_id', 'date'),
+    'experiment': ('kind', 'start', 'end'),
+    'performed': ('staff_id', 'sample_id'),
+    'plate': ('sample_id', 'date'),
+    'invalidated': ('plate_id', 'staff_id', 'date'),
+}
+
+# Covering indexes for grouped statistics (group column first).
+GROUPING_INDEXES = {
+    'sample': (('survey_id', 'reading'),),
+}
+
+# R*Tree of sample locations (one point-sized box per sample).
+SPATIAL_INDEX = 'sample_location'
+
+# Compressed bitmaps of the samples (in sample_id order) with each base at each locus.
+GENOTYPE_TABLE = 'genotype'
+
+# SNP locations and their reference bases from the genome data.
+SNP_TABLE = 'snp'
+
+# History of loads into this database file (each with a globally unique load_id).
+LOAD_TABLE = 'loads'
+
+# Tables served to mirrors: unchanged rows keep their rowids across rebuilds.
+MIRRORED_TABLES = ('sample', 'site', 'survey', *ASSAY_TABLES)
+
+# Highest rowid ever used in each mirrored table (so deleted rowids are never reused).
+HIGH_WATER_TABLE = 'high_water'
+
+# SQL column types for Python values (anything else is stored as text).
+SQL_TYPES = {int: 'INTEGER', float: 'REAL'}
 
 
 def main():
     '''Main driver.'''
-    options = parse_args()
-    con = sqlite3.connect(options.dbfile)
+    with phase('load params'):
+        options = parse_args()
+    with profile(options.profile):
+        with phase('load data'):
+            assays = json.load(open(options.assays, 'r'))
+            samples = read_csv(options.samples)
+            sites = read_csv(options.sites)
+            surveys = read_csv(options.surveys, *SURVEY_COLUMNS)
+            genomes = json.loads(Path(options.genomes).read_text()) if options.genomes else None
+        with phase('write'):
+            con = sqlite3.connect(options.dbfile)
+            tables_to_db(con, samples, sites, surveys, assays, genomes)
+            con.close()
+
+
+@timed
+def create_db(dbfile, samples, sites, surveys, assays, genomes=None):
+    '''Create all tables from in-memory dataframes.'''
+    con = sqlite3.connect(dbfile)
+    tables_to_db(
+        con,
+        frame_to_table(samples),
+        frame_to_table(sites),
+        frame_to_table(surveys, *SURVEY_COLUMNS),
+        assays,
+        genomes,
+    )
+    con.close()
+
+
+def tables_to_db(con, samples, sites, surveys, assays, genomes=None):
+    '''Create all tables from column names and rows (and SNPs if genome data is given).'''
+    table_to_db(con, 'sample', *samples)
+    table_to_db(con, 'site', *sites)
+    table_to_db(con, 'survey', *surveys)
+    for name in ASSAY_TABLES:
+        json_to_db(con, assays, name)
+    if genomes is not None:
+        snps_to_db(con, genomes)
+    create_indexes(con)
+    create_spatial_index(con)
+    create_genotype_index(con)
+    record_load(con)
+    con.commit()
+
+
+def create_indexes(con):
+    '''Index keys and filter columns so that lookups and paging do not scan tables.'''
+    for table, column in PRIMARY_KEYS.items():
+        con.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS "{table}_{column}" ON "{table}" ("{column}")')
+    for table, columns in INDEXES.items():
+        # Include the primary key so filtered pages are read in key order.
+        key = f', "{PRIMARY_KEYS[table]}"' if table in PRIMARY_KEYS else ''
+        for column in columns:
+            con.execute(f'CREATE INDEX IF NOT EXISTS "{table}_{column}" ON "{table}" ("{column}"{key})')
+    for table, groups in GROUPING_INDEXES.items():
+        for columns in groups:
+            name = '_'.join([table, *columns])
+            quoted = ', '.join(f'"{c}"' for c in columns)
+            con.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({quoted})')
+
+
+def create_spatial_index(con):
+    '''Index sample locations so that bounding-box queries do not scan samples.'''
+    con.execute(f'DROP TABLE IF EXISTS "{SPATIAL_INDEX}"')
+    con.execute(
+        f'CREATE VIRTUAL TABLE "{SPATIAL_INDEX}" USING '
+        'rtree(sample_id, min_lon, max_lon, min_lat, max_lat)'
+    )
+    con.execute(
+        f'INSERT INTO "{SPATIAL_INDEX}" '
+        'SELECT sample_id, lon, lon, lat, lat FROM sample WHERE lon IS NOT NULL AND lat IS NOT NULL'
+    )
+
+
+@timed
+def create_genotype_index(con):
+    '''Store one compressed bitset per (locus, base) so allele queries do not scan sequences.
 
-    csv_to_db(con, 'sample', options.samples)
-    csv_to_db(con, 'site', options.sites)
-    csv_to_db(con, 'survey', options.surveys, 'survey_id', 'site_id', 'date')
+    Bit i of a bitset is sample i in sample_id order (least significant bit first).
+    '''
+    import numpy as np
 
-    assays = json.load(open(options.assays, 'r'))
-    json_to_db(con, assays, 'staff')
-    json_to_db(con, assays, 'experiment')
-    json_to_db(con, assays, 'performed')
-    json_to_db(con, assays, 'plate')
-    json_to_db(con, assays, 'invalidated')
+    con.execute(f'DROP TABLE IF EXISTS "{GENOTYPE_TABLE}"')
+    con.execute(
+        f'CREATE TABLE "{GENOTYPE_TABLE}" '
+        '(locus INTEGER, base TEXT, num_samples INTEGER, bits BLOB, PRIMARY KEY (locus, base))'
+    )
+    sequences = [r[0] or '' for r in con.execute('SELECT sequence FROM sample ORDER BY sample_id')]
+    if not sequences:
+        return
+    length = max(len(s) for s in sequences)
+    text = ''.join(s.ljust(length) for s in sequences).encode('ascii')
+    matrix = np.frombuffer(text, dtype=np.uint8).reshape(len(sequences), length)
+    rows = []
+    for locus in range(length):
+        column = matrix[:, locus]
+        for code in np.unique(column):
+            if code == ord(' '):
+                continue
+            present = column == code
+            bits = np.packbits(present, bitorder='little').tobytes()
+            rows.append((locus, chr(code), int(present.sum()), zlib.compress(bits)))
+    con.executemany(f'INSERT INTO "{GENOTYPE_TABLE}" VALUES (?, ?, ?, ?)', rows)
 
 
-def csv_to_db(con, name, source, *columns):
-    '''Create table from CSV.'''
-    df = pd.read_csv(source)
+def record_load(con):
+    '''Add a load with a new unique id to this file's history.
+
+    Mirrors remember the id; the server accepts their rowid high-water marks
+    only while that id is still in the history, which is lost (and so
+    invalidates old marks) when the file is deleted or replaced.
+    '''
+    # Histories written before loads had ids cannot be trusted by mirrors.
+    if [c for (c, _) in _table_columns(con, LOAD_TABLE)] not in ([], ['version', 'load_id', 'loaded']):
+        con.execute(f'DROP TABLE "{LOAD_TABLE}"')
+    con.execute(
+        f'CREATE TABLE IF NOT EXISTS "{LOAD_TABLE}" '
+        '(version INTEGER PRIMARY KEY, load_id TEXT NOT NULL UNIQUE, loaded TEXT)'
+    )
+    loaded = datetime.now(UTC).isoformat(timespec='seconds')
+    con.execute(f'INSERT INTO "{LOAD_TABLE}" (load_id, loaded) VALUES (?, ?)', (uuid4().hex, loaded))
+
+
+def snps_to_db(con, genomes):
+    '''Create table of SNP locations and reference bases.'''
+    rows = [(loc, genomes['reference'][loc]) for loc in sorted(genomes['locations'])]
+    table_to_db(con, SNP_TABLE, ['locus', 'reference'], rows)
+
+
+def frame_to_table(df, *columns):
+    '''Get column names and rows from dataframe.'''
     if columns:
         df = df[list(columns)]
-    df.to_sql(name, con, index=False, if_exists='replace')
+    return list(df.columns), df.itertuples(index=False, name=None)
 
 
 def json_to_db(con, data, name):
     '''Create table from JSON.'''
-    df = pd.DataFrame(data[name])
-    df.to_sql(name, con, index=False, if_exists='replace')
+    records = data[name]
+    columns = list(records[0].keys()) if records else []
+    rows = ([_db_value(r[c]) for c in columns] for r in records)
+    table_to_db(con, name, columns, rows)
+
+
+def read_csv(source, *columns):
+    '''Read column names and typed rows from CSV.'''
+    with open(source, 'r', newline='') as reader:
+        header, *rows = list(csv.reader(reader))
+    if columns:
+        indices = [header.index(c) for c in columns]
+        header = list(columns)
+        rows = [[r[i] for i in indices] for r in rows]
+    converters = [_converter([r[i] for r in rows]) for i in range(len(header))]
+    return header, [[conv(v) for (conv, v) in zip(converters, r)] for r in rows]
+
+
+def table_to_db(con, name, columns, rows):
+    '''Replace table with rows, choosing column types from the values.
+
+    Mirrored tables are updated in place instead: rows that are already
+    present keep their rowids, rows that are no longer present are deleted,
+    and new or changed rows get rowids above any used before, so a mirror's
+    `since=<rowid>` finds exactly the rows added or changed since it synced.
+    '''
+    rows = [tuple(_stored_value(v) for v in r) for r in rows]
+    types = [_sql_type(rows, i) for i in range(len(columns))]
+    definitions = ', '.join(f'"{c}" {t}' for (c, t) in zip(columns, types))
+    placeholders = ', '.join('?' * len(columns))
+    if (name not in MIRRORED_TABLES) or (_table_columns(con, name) != list(zip(columns, types))):
+        con.execute(f'DROP TABLE IF EXISTS "{name}"')
+        con.execute(f'CREATE TABLE "{name}" ({definitions})')
+    if name not in MIRRORED_TABLES:
+        con.executemany(f'INSERT INTO "{name}" VALUES ({placeholders})', rows)
+        return
+
+    quoted = ', '.join(f'"{c}"' for c in columns)
+    present = {}
+    for rowid, *values in con.execute(f'SELECT rowid, {quoted} FROM "{name}" ORDER BY rowid'):
+        present.setdefault(tuple(values), []).append(rowid)
+    added = []
+    for row in rows:
+        kept = present.get(row)
+        if kept:
+            kept.pop(0)
+        else:
+            added.append(row)
+    removed = [(rowid,) for rowids in present.values() for rowid in rowids]
+    con.executemany(f'DELETE FROM "{name}" WHERE rowid = ?', removed)
+
+    con.execute(f'CREATE TABLE IF NOT EXISTS "{HIGH_WATER_TABLE}" (name TEXT PRIMARY KEY, rowid INTEGER)')
+    (start,) = con.execute(
+        f'SELECT max(coalesce((SELECT rowid FROM "{HIGH_WATER_TABLE}" WHERE name = ?), 0), '
+        f'coalesce((SELECT max(rowid) FROM "{name}"), 0))',
+        (name,),
+    ).fetchone()
+    con.executemany(
+        f'INSERT INTO "{name}" (rowid, {quoted}) VALUES (?, {placeholders})',
+        ((start + i + 1, *row) for (i, row) in enumerate(added)),
+    )
+    con.execute(
+        f'INSERT OR REPLACE INTO "{HIGH_WATER_TABLE}" VALUES (?, ?)', (name, start + len(added))
+    )
+
+
+def _converter(values):
+    '''Choose the narrowest conversion that works for all text values.'''
+    for conv in (int, float):
+        try:
+            for v in values:
+                if v:
+                    conv(v)
+            return lambda v, conv=conv: conv(v) if v else None
+        except ValueError:
+            pass
+    return lambda v: v
+
+
+def _sql_type(rows, i):
+    '''Get the SQL type of the first non-null value in a column.'''
+    for row in rows:
+        if row[i] is not None:
+            return SQL_TYPES.get(type(row[i]), 'TEXT')
+    return 'TEXT'
+
+
+def _stored_value(value):
+    '''Convert a value to what SQLite will give back (so rows can be compared with stored rows).'''
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def _table_columns(con, name):
+    '''Get (name, declared type) pairs of a table's columns (empty if there is no table).'''
+    return [(r[1], r[2]) for r in con.execute(f'PRAGMA table_info("{name}")')]
+
+
+def _db_value(value):
+    '''Convert dates to ISO text for storage.'''
+    return value.isoformat() if isinstance(value, date) else value
 
 
 def parse_args():
@@ -42,9 +317,11 @@ def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('--assays', type=str, required=True, help='assay data file')
     parser.add_argument('--dbfile', type=str, required=True, help='output database file')
+    parser.add_argument('--genomes', type=str, default=None, help='genome data file (for SNP locations)')
     parser.add_argument('--samples', type=str, required=True, help='samples data file')
     parser.add_argument('--sites', type=str, required=True, help='sites parameter file')
     parser.add_argument('--surveys', type=str, required=True, help='surveys parameter file')
+    add_profile_args(parser)
     return parser.parse_args()
 
 
@@ -7,6 +7,7 @@ from pathlib import Path
 import random
 
 from params import GenomeParams, load_params
+from profiling import add_profile_args, phase, profile, timed
 
 # Bases.
 DNA = 'ACGT'
@@ -32,18 +33,15 @@ class GenePool:
 
 def main():
     '''Main driver.'''
-    options = parse_args()
-    random.seed(options.params.seed)
-    genomes = random_genomes(
-        options.params.length,
-        options.params.num_genomes,
-        options.params.num_snp,
-        options.params.prob_other,
-    )
-    add_susceptibility(genomes)
-    save(options.outfile, genomes)
+    with phase('load params'):
+        options = parse_args()
+    with profile(options.profile):
+        with phase('generate'):
+            genomes = generate_genomes(options.params)
+        save(options.outfile, genomes)
 
 
+@timed
 def add_susceptibility(genomes):
     '''Add indication of genetic susceptibility.'''
     if not genomes.locations:
@@ -54,11 +52,25 @@ def add_susceptibility(genomes):
     genomes.susceptible_base = _choose_one(list(choices))
 
 
+def generate_genomes(params):
+    '''Generate genomes with susceptibility from parameters.'''
+    random.seed(params.seed)
+    genomes = random_genomes(
+        params.length,
+        params.num_genomes,
+        params.num_snp,
+        params.prob_other,
+    )
+    add_susceptibility(genomes)
+    return genomes
+
+
 def parse_args():
     '''Get command-line arguments.'''
     parser = argparse.ArgumentParser()
     parser.add_argument('--outfile', type=str, default=None, help='output file')
     parser.add_argument('--params', type=str, required=True, help='parameter file')
+    add_profile_args(parser)
     options = parser.parse_args()
     assert options.params != options.outfile, 'Cannot use same filename for options and parameters'
     options.params = load_params(GenomeParams, options.params)
@@ -71,6 +83,7 @@ def random_bases(length):
     return ''.join(random.choices(DNA, k=length))
 
 
+@timed
 def random_genomes(length, num_genomes, num_snp, prob_other):
     '''Generate a set of genomes with specified number of point mutations.'''
     assert 0 <= num_snp <= length
@@ -104,11 +117,13 @@ def random_genomes(length, num_genomes, num_snp, prob_other):
 
 def save(outfile, genomes):
     '''Save or show generated data.'''
-    as_text = json.dumps(asdict(genomes), indent=4)
-    if outfile:
-        Path(outfile).write_text(as_text)
-    else:
-        print(as_text)
+    with phase('serialize'):
+        as_text = json.dumps(asdict(genomes), indent=4)
+    with phase('write'):
+        if outfile:
+            Path(outfile).write_text(as_text)
+        else:
+            print(as_text)
 
 
 def _mutate_snps(reference, genome, loc, bases):
@@ -10,6 +10,7 @@ import random
 import sys
 
 from params import AssayParams, load_params
+from profiling import add_profile_args, phase, profile, timed
 
 
 MODEL = 'Weyland-Yutani 470'
@@ -19,20 +20,26 @@ PLATE_WIDTH = 4
 
 def main():
     '''Main driver.'''
-    options = parse_args()
-    random.seed(options.params.seed)
-    create_files(options)
+    with phase('load params'):
+        options = parse_args()
+    with profile(options.profile):
+        with phase('load data'):
+            assays = json.load(open(options.assays, 'r'))
+        with phase('generate'):
+            create_files(options.params, assays, options.designs, options.readings)
 
 
-def create_files(options):
+@timed
+def create_files(params, assays, designs, readings):
     '''Create randomized plate files.'''
-    for filename, sample_id, kind in join_assay_data(options):
+    random.seed(params.seed)
+    for filename, sample_id, kind in join_assay_data(assays):
         make_plate(
-            options.params,
+            params,
             sample_id,
             kind,
-            Path(options.designs, filename),
-            Path(options.readings, filename),
+            Path(designs, filename),
+            Path(readings, filename),
         )
 
 
@@ -47,9 +54,8 @@ def generate(params, func):
     return [title_row, *labeled]
 
 
-def join_assay_data(options):
+def join_assay_data(assays):
     '''Get experiment type and plate filename from data.'''
-    assays = json.load(open(options.assays, 'r'))
     experiments = {x['sample_id']: x['kind'] for x in assays['experiment']}
     plates = {p['filename']: p['sample_id'] for p in assays['plate']}
     return ((f, plates[f], experiments[plates[f]]) for f in plates)
@@ -113,6 +119,7 @@ def parse_args():
     parser.add_argument('--designs', type=str, required=True, help='designs directory')
     parser.add_argument('--params', type=str, required=True, help='parameter file')
     parser.add_argument('--readings', type=str, required=True, help='readings directory')
+    add_profile_args(parser)
     options = parser.parse_args()
     options.params = load_params(AssayParams, options.params)
     return options
@@ -120,6 +127,12 @@ def parse_args():
 
 def save_csv(filename, rows):
     '''Save as CSV.'''
+    with phase('write'):
+        _write_csv(filename, rows)
+
+
+def _write_csv(filename, rows):
+    '''Write rows to a file or standard output.'''
     if not filename:
         csv.writer(sys.stdout).writerows(rows)
     else:
@@ -3,14 +3,11 @@
 
 import argparse
 import json
-from pathlib import Path
-import pandas as pd
 import random
-
-from geopy.distance import lonlat, distance
+from pathlib import Path
 
 from params import SampleParams, load_params
-
+from profiling import add_profile_args, phase, profile, timed
 
 CIRCLE = 360.0
 LON_LAT_PRECISION = 5
@@ -22,23 +19,31 @@ SNAIL_PRECISION = 1
 
 def main():
     '''Main driver.'''
-    options = parse_args()
-    random.seed(options.params.seed)
-    genomes = json.loads(Path(options.genomes).read_text())
-    geo_params = get_geo_params(options)
-    samples = generate_samples(options, genomes, geo_params)
-    save(options, samples)
-
-
-def generate_samples(options, genomes, geo_params):
+    with phase('load params'):
+        options = parse_args()
+    with profile(options.profile):
+        with phase('load data'):
+            import pandas as pd
+            genomes = json.loads(Path(options.genomes).read_text())
+            geo_params = get_geo_params(pd.read_csv(options.sites), pd.read_csv(options.surveys))
+        with phase('generate'):
+            samples = generate_samples(options.params, genomes, geo_params)
+        save(options.outfile, samples)
+
+
+@timed
+def generate_samples(params, genomes, geo_params):
     '''Generate snail samples.'''
+    import pandas as pd
+    from geopy.distance import distance, lonlat
+    random.seed(params.seed)
     samples = []
     for i, sequence in enumerate(genomes['individuals']):
-        survey_id, point, scale = random_geo(geo_params)
+        survey_id, point, scale = random_geo(geo_params, lonlat, distance)
         if sequence[genomes['susceptible_loc']] == genomes['susceptible_base']:
-            limit = options.params.mutant
+            limit = params.mutant
         else:
-            limit = options.params.normal
+            limit = params.normal
         reading = random.uniform(
             MIN_SNAIL_SIZE, MIN_SNAIL_SIZE + MAX_SNAIL_SIZE * limit * scale
         )
@@ -52,10 +57,8 @@ def generate_samples(options, genomes, geo_params):
     return df
 
 
-def get_geo_params(options):
+def get_geo_params(sites, surveys):
     '''Get geographic parameters.'''
-    sites = pd.read_csv(Path(options.sites))
-    surveys = pd.read_csv(Path(options.surveys))
     return sites.merge(surveys, how='inner', on='site_id')
 
 
@@ -67,14 +70,18 @@ def parse_args():
     parser.add_argument('--params', type=str, required=True, help='parameter file')
     parser.add_argument('--sites', type=str, required=True, help='sites parameter file')
     parser.add_argument('--surveys', type=str, required=True, help='surveys parameter file')
+    add_profile_args(parser)
     options = parser.parse_args()
     assert options.params != options.outfile, 'Cannot use same filename for options and parameters'
     options.params = load_params(SampleParams, options.params)
     return options
 
 
-def random_geo(geo_params):
-    '''Generate random geo point within radius of center of randomly-chosen site.'''
+def random_geo(geo_params, lonlat, distance):
+    '''Generate random geo point within radius of center of randomly-chosen site.
+
+    `lonlat` and `distance` come from geopy, which the caller imports once.
+    '''
     row = random.randrange(geo_params.shape[0])
     survey_id = geo_params.at[row, 'survey_id']
     center = lonlat(float(geo_params.at[row, 'lon']), float(geo_params.at[row, 'lat']))
@@ -86,12 +93,15 @@ def random_geo(geo_params):
     return survey_id, point, scale
 
 
-def save(options, samples):
+def save(outfile, samples):
     '''Save or show results.'''
-    if options.outfile:
-        Path(options.outfile).write_text(samples.to_csv(index=False))
-    else:
-        print(samples.to_csv(index=False))
+    with phase('serialize'):
+        as_text = samples.to_csv(index=False)
+    with phase('write'):
+        if outfile:
+            Path(outfile).write_text(as_text)
+        else:
+            print(as_text)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,99 @@
+'''Optional profiling for data generation scripts.
+
+Timers are always on because they are cheap; `--profile PREFIX` adds a
+cProfile dump in `PREFIX.prof` and writes the timings and the top memory
+allocations as JSON to `PREFIX.json`.
+
+Timings are labelled with the path of enclosing phases in the same thread
+(e.g., 'generate/create_files/write'), so a phase's time includes the time
+of the phases listed beneath it rather than being counted twice at the top.
+'''
+
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+
+# Number of allocation sites to report.
+TOP_ALLOCATIONS = 20
+
+# Accumulated timings by phase path (updated under TIMINGS_LOCK).
+TIMINGS = defaultdict(lambda: {'seconds': 0.0, 'calls': 0})
+TIMINGS_LOCK = threading.Lock()
+
+# Each thread's stack of open phases.
+_open_phases = threading.local()
+
+
+def add_profile_args(parser):
+    '''Add the shared profiling option to a parser.'''
+    parser.add_argument('--profile', type=str, default=None, help='profile output prefix')
+
+
+@contextmanager
+def phase(name):
+    '''Time a block of code under its path of enclosing phases.'''
+    if not hasattr(_open_phases, 'stack'):
+        _open_phases.stack = []
+    _open_phases.stack.append(name)
+    label = '/'.join(_open_phases.stack)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _open_phases.stack.pop()
+        with TIMINGS_LOCK:
+            record = TIMINGS[label]
+            record['seconds'] += elapsed
+            record['calls'] += 1
+
+
+@contextmanager
+def profile(prefix, top=TOP_ALLOCATIONS):
+    '''Profile a block of code if an output prefix is given.'''
+    if not prefix:
+        yield
+        return
+
+    import cProfile
+    import tracemalloc
+    tracemalloc.start()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        profiler.dump_stats(f'{prefix}.prof')
+        with TIMINGS_LOCK:
+            timings = {label: dict(record) for (label, record) in TIMINGS.items()}
+        report = {
+            'timings': timings,
+            'peak_bytes': peak,
+            'allocations': [
+                {
+                    'file': stat.traceback[0].filename,
+                    'line': stat.traceback[0].lineno,
+                    'bytes': stat.size,
+                    'count': stat.count,
+                }
+                for stat in snapshot.statistics('lineno')[:top]
+            ],
+        }
+        Path(f'{prefix}.json').write_text(json.dumps(report, indent=4))
+
+
+def timed(func):
+    '''Decorate a function to record its running time under its name.'''
+    @wraps(func)
+    def _inner(*args, **kwargs):
+        with phase(func.__name__):
+            return func(*args, **kwargs)
+    return _inner
@@ -0,0 +1,118 @@
+'''Skip pipeline stages whose inputs have not changed.
+
+The key for a stage is a hash of the contents of its input files (including
+the stage's own source and parameter files) and of the command used to run
+it, so touching a file or checking it out again does not force regeneration.
+'''
+
+import argparse
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+# Default limit on the total size of cached outputs (least recently used are evicted).
+MAX_BYTES = 1024 * 1024 * 1024
+
+
+def main():
+    '''Main driver.'''
+    options = parse_args()
+    key = stage_key(options.inputs, options.command)
+    if restore(options.cache, key, options.outputs):
+        print(f'restored {" ".join(options.outputs)} from cache', file=sys.stderr)
+        return
+    result = subprocess.run(options.command, check=False)
+    if result.returncode != 0:
+        sys.exit(result.returncode)
+    store(options.cache, key, options.outputs)
+    evict(options.cache, options.max_bytes)
+
+
+def parse_args():
+    '''Parse command-line arguments.'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cache', type=str, required=True, help='cache directory')
+    parser.add_argument('--max-bytes', type=int, default=MAX_BYTES, help='cache size limit')
+    parser.add_argument('--inputs', type=str, nargs='+', required=True, help='files the stage depends on')
+    parser.add_argument('--outputs', type=str, nargs='+', required=True, help='files or directories the stage creates')
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='command to run (after --)')
+    options = parser.parse_args()
+    if options.command and (options.command[0] == '--'):
+        options.command = options.command[1:]
+    assert options.command, 'No command given'
+    return options
+
+
+def evict(cache_dir, max_bytes):
+    '''Remove least recently used entries until the cache is no larger than `max_bytes`.'''
+    entries = [p for p in Path(cache_dir).iterdir() if p.is_dir() and (p.suffix != '.tmp')]
+    entries.sort(key=lambda p: p.stat().st_mtime)
+    sizes = {p: sum(f.stat().st_size for f in _files(p)) for p in entries}
+    total = sum(sizes.values())
+    for entry in entries:
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= sizes[entry]
+
+
+def restore(cache_dir, key, outputs):
+    '''Copy cached outputs into place, returning True if there were any.'''
+    entry = Path(cache_dir, key)
+    if not entry.is_dir():
+        return False
+    for i, dst in enumerate(outputs):
+        _copy(Path(entry, str(i)), Path(dst))
+    # Mark the entry as recently used so eviction keeps it.
+    os.utime(entry)
+    return True
+
+
+def stage_key(inputs, command):
+    '''Hash input file contents and the command that uses them.'''
+    digest = hashlib.sha256()
+    for arg in command:
+        digest.update(arg.encode('utf-8'))
+        digest.update(b'\0')
+    for path in sorted(inputs):
+        for filename in _files(Path(path)):
+            digest.update(str(filename).encode('utf-8'))
+            digest.update(b'\0')
+            with open(filename, 'rb') as reader:
+                digest.update(hashlib.file_digest(reader, 'sha256').digest())
+    return digest.hexdigest()
+
+
+def store(cache_dir, key, outputs):
+    '''Save outputs in the cache under the given key.'''
+    entry = Path(cache_dir, key)
+    temp = Path(cache_dir, f'{key}.tmp')
+    shutil.rmtree(temp, ignore_errors=True)
+    temp.mkdir(parents=True)
+    for i, src in enumerate(outputs):
+        _copy(Path(src), Path(temp, str(i)))
+    shutil.rmtree(entry, ignore_errors=True)
+    temp.rename(entry)
+
+
+def _copy(src, dst):
+    '''Copy a file or directory, giving the copy a fresh timestamp.'''
+    if src.is_dir():
+        shutil.rmtree(dst, ignore_errors=True)
+        shutil.copytree(src, dst, copy_function=shutil.copy)
+    else:
+        shutil.copy(src, dst)
+
+
+def _files(path):
+    '''List the files under a path in a stable order.'''
+    if path.is_dir():
+        return sorted(p for p in path.rglob('*') if p.is_file())
+    return [path]
+
+
+if __name__ == '__main__':
+    main()
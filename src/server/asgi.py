@@ -0,0 +1,60 @@
+'''Serve the data server's routes through ASGI.
+
+The event loop holds client connections open cheaply; a2wsgi runs each
+request's Flask handler in a bounded thread pool that is the same size as
+the database connection pool, so one process can accept thousands of
+connections while running at most that many database queries at once.
+
+Streaming responses (NDJSON pages and exports) are still WSGI iterators:
+a handler thread produces their chunks until the last one is queued, and
+because the queue is bounded a slow client can keep that thread waiting.
+Size `--threads` with long exports in mind.
+'''
+
+import argparse
+
+from a2wsgi import WSGIMiddleware
+
+import similarity
+from cache import DISK_BYTES
+from db import POOL_SIZE, prepare_db
+from server import CACHE_BYTES, create_app
+
+
+def create_asgi_app(dbfile, threads=POOL_SIZE, **kwargs):
+    '''Create an ASGI application wrapping a Flask app created for `dbfile`.'''
+    return WSGIMiddleware(create_app(dbfile, threads=threads, **kwargs), workers=threads)
+
+
+def parse_args():
+    '''Parse command-line arguments.'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cache-bytes', type=int, default=CACHE_BYTES, help='in-memory response cache size')
+    parser.add_argument('--cache-dir', type=str, default=None, help='shared on-disk response cache')
+    parser.add_argument('--cache-dir-bytes', type=int, default=DISK_BYTES, help='on-disk response cache size')
+    parser.add_argument('--data-dir', type=str, default=None, help='plate files directory (default: database directory)')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--immutable', action='store_true', help='database will not change while serving')
+    parser.add_argument('--port', type=int, default=5000, help='port to listen on')
+    parser.add_argument('--similarity-threads', type=int, default=similarity.THREADS, help='threads shared by similarity searches')
+    parser.add_argument('--threads', type=int, default=POOL_SIZE, help='handler threads and pooled connections')
+    parser.add_argument('dbfile', type=str, help='database file')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    options = parse_args()
+    prepare_db(options.dbfile)
+    app = create_asgi_app(
+        options.dbfile,
+        threads=options.threads,
+        cache_bytes=options.cache_bytes,
+        cache_dir=options.cache_dir,
+        cache_dir_bytes=options.cache_dir_bytes,
+        data_dir=options.data_dir,
+        immutable=options.immutable,
+        similarity_threads=options.similarity_threads,
+    )
+    uvicorn.run(app, host=options.host, port=options.port, lifespan='on')
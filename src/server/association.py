@@ -0,0 +1,92 @@
+'''Scan every locus for alleles associated with sample readings.
+
+Counts, sums, and sums of squares of readings for every (locus, base) are
+gathered in one pass with `np.bincount`, so the cost is a few array
+operations per block of samples rather than a Python loop over loci.
+'''
+
+import numpy as np
+
+import reader
+import similarity
+from cache import versioned
+
+# Names of the fields in each result.
+FIELDS = ('locus', 'base', 'num_with', 'mean_with', 'mean_without', 'effect', 't')
+
+
+@versioned
+def scan(engine):
+    '''Get per-allele effect statistics ordered by decreasing |t| (None if there are no genomes).
+
+    `effect` is the difference in mean reading between samples with and
+    without the allele; `t` is Welch's t statistic for that difference.
+    Only alleles at loci that vary are included.
+    '''
+    genomes = similarity.load(engine)
+    if genomes is None:
+        return None
+    readings = _readings(engine, genomes)
+    bases = len(similarity.CODES)
+    slots = genomes.length * bases
+    offsets = np.arange(genomes.length, dtype=np.int64) * bases
+    counts = np.zeros(slots)
+    sums = np.zeros(slots)
+    squares = np.zeros(slots)
+    # Samples unpacked and counted at a time (bounds temporary memory).
+    chunk_rows = similarity.unpack_rows(genomes.length)
+    for start in range(0, len(readings), chunk_rows):
+        values = readings[start:start + chunk_rows]
+        valid = ~np.isnan(values)
+        words, values = genomes.words[start:start + chunk_rows][valid], values[valid]
+        keys = (similarity.unpack(words, slice(genomes.length)) + offsets).ravel()
+        weights = np.repeat(values, genomes.length)
+        counts += np.bincount(keys, minlength=slots)
+        sums += np.bincount(keys, weights=weights, minlength=slots)
+        squares += np.bincount(keys, weights=weights * weights, minlength=slots)
+    return _statistics(counts, sums, squares, readings, bases)
+
+
+def _readings(engine, genomes):
+    '''Get readings in the same order as the packed genomes (NaN if missing).'''
+    rows = reader.query(
+        engine, 'SELECT sample_id, reading FROM sample WHERE sequence IS NOT NULL ORDER BY sample_id'
+    )
+    ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    assert np.array_equal(ids, genomes.ids), 'Samples changed while loading'
+    return np.array([np.nan if r[1] is None else r[1] for r in rows], dtype=np.float64)
+
+
+def _statistics(counts, sums, squares, readings, bases):
+    '''Turn per-allele counts and sums into effect sizes and t statistics.'''
+    readings = readings[~np.isnan(readings)]
+    total_n = counts.reshape(-1, bases).sum(axis=1).repeat(bases)
+    total_sum, total_squares = readings.sum(), (readings * readings).sum()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n_with, n_without = counts, total_n - counts
+        mean_with = sums / n_with
+        mean_without = (total_sum - sums) / n_without
+        var_with = (squares - n_with * mean_with**2) / (n_with - 1)
+        var_without = ((total_squares - squares) - n_without * mean_without**2) / (n_without - 1)
+        effect = mean_with - mean_without
+        t = effect / np.sqrt(np.maximum(var_with, 0) / n_with + np.maximum(var_without, 0) / n_without)
+    keep = np.flatnonzero((n_with > 0) & (n_without > 0))
+    keep = keep[np.argsort(-np.nan_to_num(np.abs(t[keep]), nan=-1.0), kind='stable')]
+    names = list(similarity.CODES)
+    return [
+        dict(zip(FIELDS, (
+            int(i // bases),
+            names[i % bases],
+            int(n_with[i]),
+            _number(mean_with[i]),
+            _number(mean_without[i]),
+            _number(effect[i]),
+            _number(t[i]),
+        )))
+        for i in keep
+    ]
+
+
+def _number(value):
+    '''Convert a numpy value to a float (None if undefined).'''
+    return float(value) if np.isfinite(value) else None
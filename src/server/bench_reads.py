@@ -0,0 +1,71 @@
+'''Compare reading tables through the ORM with reading raw rows.'''
+
+import argparse
+import json
+import time
+
+from sqlmodel import Session, create_engine, select
+
+import reader
+from models import (
+    Experiment,
+    Invalidated,
+    Performed,
+    Plate,
+    Sample,
+    Site,
+    Staff,
+    Survey,
+)
+
+TABLES = [Site, Survey, Sample, Staff, Experiment, Performed, Plate, Invalidated]
+
+
+def main():
+    '''Main driver.'''
+    options = parse_args()
+    engine = create_engine(f'sqlite:///{options.dbfile}')
+    results = {
+        table.__name__: {
+            'orm': rows_per_second(read_orm, engine, table, options.repeat),
+            'raw': rows_per_second(read_raw, engine, table, options.repeat),
+        }
+        for table in TABLES
+    }
+    for speeds in results.values():
+        speeds['speedup'] = speeds['raw'] / speeds['orm'] if speeds['orm'] else None
+    print(json.dumps(results, indent=4))
+
+
+def parse_args():
+    '''Parse command-line arguments.'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5, help='number of timing runs')
+    parser.add_argument('dbfile', type=str, help='database file')
+    return parser.parse_args()
+
+
+def read_orm(engine, table):
+    '''Read all rows as model objects and convert them to dictionaries.'''
+    with Session(engine) as session:
+        return [r.model_dump() for r in session.exec(select(table)).all()]
+
+
+def read_raw(engine, table):
+    '''Read all rows as tuples and convert them to dictionaries.'''
+    return reader.to_records(table, reader.fetch(engine, table))
+
+
+def rows_per_second(func, engine, table, repeat):
+    '''Best rate over several runs.'''
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        num_rows = len(func(engine, table))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return num_rows / best if best else 0.0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+'''Caches that are invalidated when the database changes.'''
+
+import gzip
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from functools import wraps
+from pathlib import Path
+from threading import Lock, get_ident
+
+# Compression level for cached responses (favoring speed).
+GZIP_LEVEL = 6
+
+# Default size limit of the on-disk response cache.
+DISK_BYTES = 1024 * 1024 * 1024
+
+# Fraction of the disk limit a process writes before it prunes the directory.
+PRUNE_FRACTION = 16
+
+
+def db_version(engine):
+    '''Identify the current state of the database file (None if unknown).'''
+    dbfile = engine.url.database
+    if not dbfile:
+        return None
+    dbfile = dbfile.removeprefix('file:')
+    try:
+        stats = [os.stat(dbfile)]
+    except FileNotFoundError:
+        return None
+    try:
+        stats.append(os.stat(f'{dbfile}-wal'))
+    except FileNotFoundError:
+        pass
+    return tuple((s.st_mtime_ns, s.st_size) for s in stats)
+
+
+def versioned(func):
+    '''Remember a function's results until the database changes.
+
+    The function's first argument must be the engine; its other arguments
+    must be hashable.
+    '''
+    results = {}
+
+    @wraps(func)
+    def _inner(engine, *args):
+        version = db_version(engine)
+        key = (engine.url, *args)
+        found = results.get(key)
+        if (version is not None) and (found is not None) and (found[0] == version):
+            return found[1]
+        value = func(engine, *args)
+        results[key] = (version, value)
+        return value
+
+    return _inner
+
+
+class ResponseCache:
+    '''Least-recently-used cache of gzipped responses with an optional disk tier.
+
+    Entries are (status, headers, compressed body). The in-memory tier is
+    limited by the total size of the compressed bodies; the disk tier is
+    shared by all processes that use the same directory and is pruned back
+    to `disk_bytes` least-recently-used first (so entries for old database
+    versions age out).
+    '''
+
+    def __init__(self, max_bytes, directory=None, disk_bytes=DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.directory = Path(directory) if directory else None
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        self.disk_bytes = disk_bytes
+        self.written = 0
+        self.entries = OrderedDict()
+        self.num_bytes = 0
+        self.lock = Lock()
+        self.prune_lock = Lock()
+
+    def get(self, key):
+        '''Get an entry (or None), checking memory then disk.'''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                return entry
+        entry = self._read(key)
+        if entry is not None:
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key, status, headers, body):
+        '''Compress and save a response body.'''
+        entry = (status, headers, gzip.compress(body, compresslevel=GZIP_LEVEL))
+        self._remember(key, entry)
+        self._write(key, entry)
+        return entry
+
+    def _path(self, key):
+        '''Disk location for a key.'''
+        return Path(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+    def _read(self, key):
+        '''Load an entry from disk if there is one.'''
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            raw = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        header, body = raw.split(b'\n', 1)
+        meta = json.loads(header)
+        if meta['key'] != key:
+            return None
+        return (meta['status'], [tuple(h) for h in meta['headers']], body)
+
+    def _remember(self, key, entry):
+        '''Add an entry to memory, evicting old entries to stay under size.'''
+        size = len(entry[2])
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.num_bytes -= len(old[2])
+            self.entries[key] = entry
+            self.num_bytes += size
+            while self.num_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.num_bytes -= len(evicted[2])
+
+    def _write(self, key, entry):
+        '''Save an entry to disk atomically.'''
+        if not self.directory:
+            return
+        status, headers, body = entry
+        header = json.dumps({'key': key, 'status': status, 'headers': headers})
+        path = self._path(key)
+        temp = path.with_suffix(f'.{os.getpid()}.{get_ident()}.tmp')
+        temp.write_bytes(header.encode('utf-8') + b'\n' + body)
+        os.replace(temp, path)
+        with self.lock:
+            self.written += len(header) + len(body)
+            due = self.written * PRUNE_FRACTION >= self.disk_bytes
+            if due:
+                self.written = 0
+        if due:
+            self.prune()
+
+    def prune(self):
+        '''Delete least-recently-used files until the disk tier fits its limit.'''
+        if (not self.directory) or (not self.prune_lock.acquire(blocking=False)):
+            return
+        try:
+            files = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    info = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((info.st_mtime_ns, info.st_size, entry.path))
+            total = sum(size for (_, size, _) in files)
+            for _, size, path in sorted(files):
+                if total <= self.disk_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+        finally:
+            self.prune_lock.release()
@@ -0,0 +1,61 @@
+'''Check that detail routes use a fixed number of queries.'''
+
+import argparse
+import sqlite3
+import sys
+
+from sqlalchemy import event
+
+from server import create_app
+
+# Most queries each detail route may run (one per eagerly-loaded level).
+BUDGETS = {
+    'experiment': 4,
+    'survey': 2,
+}
+
+# SQL to find entities with the most related rows, which is where N+1 shows.
+BUSIEST = {
+    'experiment': 'SELECT sample_id FROM plate GROUP BY sample_id ORDER BY count(*) DESC LIMIT 1',
+    'survey': 'SELECT survey_id FROM sample GROUP BY survey_id ORDER BY count(*) DESC LIMIT 1',
+}
+
+
+def main():
+    '''Main driver.'''
+    options = parse_args()
+    app = create_app(options.dbfile, cache_bytes=0)
+    statements = []
+    event.listen(
+        app.config['ENGINE'], 'before_cursor_execute', lambda *args: statements.append(args[2])
+    )
+    client = app.test_client()
+    con = sqlite3.connect(options.dbfile)
+    problems = []
+    for route, budget in BUDGETS.items():
+        (key,) = con.execute(BUSIEST[route]).fetchone()
+        for fmt in ('', '?fmt=json'):
+            statements.clear()
+            url = f'/{route}/{key}{fmt}'
+            status = client.get(url).status_code
+            print(f'{url}: {status}, {len(statements)} queries')
+            if status != 200:
+                problems.append(f'{url} returned {status}')
+            if len(statements) > budget:
+                problems.append(f'{url} ran {len(statements)} queries (budget {budget})')
+    con.close()
+    for line in problems:
+        print(line, file=sys.stderr)
+    if problems:
+        sys.exit(1)
+
+
+def parse_args():
+    '''Parse command-line arguments.'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dbfile', type=str, help='database file')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
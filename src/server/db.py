@@ -0,0 +1,103 @@
+'''Read-only database engines for serving, and one-time database preparation.
+
+`prepare_db` may write to the database, so it runs once before serving
+starts (`python db.py data/lab.db`, or the `prepare` target in the
+Makefile) rather than in every worker process.
+'''
+
+import argparse
+import sqlite3
+from pathlib import Path
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from sqlmodel import SQLModel, create_engine
+
+# Default number of pooled connections (one per serving thread).
+POOL_SIZE = 8
+
+# Settings for each read-only connection (paging through 800K samples ran
+# at the same rate with and without the cache settings, so they are modest).
+PRAGMAS = {
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+    'query_only': 'ON',
+}
+
+
+def make_engine(dbfile, pool_size=POOL_SIZE, immutable=False):
+    '''Create a read-only engine with a fixed-size pool of connections.
+
+    `immutable` tells SQLite the file will not change while it is open, which
+    skips locking entirely; only use it if the database is never rebuilt
+    while the server is running.
+    '''
+    options = 'mode=ro&uri=true' + ('&immutable=1' if immutable else '')
+    engine = create_engine(
+        f'sqlite:///file:{Path(dbfile).resolve()}?{options}',
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=0,
+        connect_args={'check_same_thread': False},
+    )
+    event.listen(engine, 'connect', _set_pragmas)
+    return engine
+
+
+def main():
+    '''Main driver.'''
+    import models  # noqa: F401 (registers the tables to create)
+
+    options = parse_args()
+    prepare_db(options.dbfile)
+
+
+def parse_args():
+    '''Parse command-line arguments.'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dbfile', type=str, help='database file')
+    return parser.parse_args()
+
+
+def prepare_db(dbfile):
+    '''Create missing tables unless the database already matches the models.'''
+    if Path(dbfile).exists() and (_fingerprint(dbfile) >= _model_fingerprint()):
+        return
+    engine = create_engine(f'sqlite:///{dbfile}')
+    SQLModel.metadata.create_all(engine)
+    engine.dispose()
+
+
+def _fingerprint(dbfile):
+    '''Get the (table, column) pairs in a database.'''
+    con = sqlite3.connect(f'file:{Path(dbfile).resolve()}?mode=ro', uri=True)
+    try:
+        tables = [r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        return {
+            (t, r[1]) for t in tables for r in con.execute(f'PRAGMA table_info("{t}")')
+        }
+    finally:
+        con.close()
+
+
+def _model_fingerprint():
+    '''Get the (table, column) pairs the models need (rowid is implicit).'''
+    return {
+        (table.name, column.name)
+        for table in SQLModel.metadata.sorted_tables
+        for column in table.columns
+        if column.name != 'rowid'
+    }
+
+
+def _set_pragmas(con, record):
+    '''Apply PRAGMAS to a new connection.'''
+    cursor = con.cursor()
+    for name, value in PRAGMAS.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+    cursor.close()
+
+
+if __name__ == '__main__':
+    main()
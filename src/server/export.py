@@ -0,0 +1,150 @@
+'''Export whole tables in columnar formats built batch by batch from cursors.
+
+Arrow IPC and Parquet need pyarrow, which is only imported when they are
+asked for; CSV needs nothing extra. Clients can load the results with
+`pyarrow.ipc.open_stream`, `pandas.read_parquet`, or `pandas.read_csv`.
+'''
+
+import csv
+import io
+from datetime import date as date_type
+
+from sqlalchemy import inspect
+
+import reader
+
+# Rows per record batch (or Parquet row group).
+EXPORT_BATCH_SIZE = 64 * 1024
+
+# Media types of the export formats.
+FORMATS = {
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+    'csv': 'text/csv',
+}
+
+# Formats that need pyarrow.
+ARROW_FORMATS = {'arrow', 'parquet'}
+
+
+def available(fmt):
+    '''Can this process produce a format?'''
+    if fmt not in FORMATS:
+        return False
+    if fmt not in ARROW_FORMATS:
+        return True
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def export(engine, table, fmt, names=None, filters=(), batch_size=EXPORT_BATCH_SIZE):
+    '''Generate chunks of bytes holding a table in the given format.'''
+    names = list(names or reader.columns(table))
+    batches = reader.iterate(engine, table, batch_size=batch_size, names=names, filters=filters)
+    if fmt == 'csv':
+        return _csv(batches, names)
+    schema = _schema(table, names)
+    if fmt == 'arrow':
+        return _arrow(batches, schema)
+    if fmt == 'parquet':
+        return _parquet(batches, schema)
+    raise ValueError(f'unknown export format {fmt}')
+
+
+def _arrow(batches, schema):
+    '''Write an Arrow IPC stream one record batch at a time.'''
+    import pyarrow as pa
+
+    sink = _Chunks()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for batch in batches:
+            writer.write_batch(_record_batch(batch, schema))
+            yield sink.take()
+    yield sink.take()
+
+
+def _parquet(batches, schema):
+    '''Write a Parquet file one row group at a time.'''
+    import pyarrow.parquet as pq
+
+    sink = _Chunks()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for batch in batches:
+            writer.write_batch(_record_batch(batch, schema))
+            yield sink.take()
+    yield sink.take()
+
+
+def _csv(batches, names):
+    '''Write CSV text one batch at a time.'''
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(names)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def _record_batch(rows, schema):
+    '''Transpose a list of rows into an Arrow record batch.'''
+    import pyarrow as pa
+
+    columns = zip(*rows) if rows else [[] for _ in schema]
+    arrays = []
+    for field, values in zip(schema, columns):
+        # SQLite's storage type may not match the model (e.g., ISO dates).
+        array = pa.array(values)
+        arrays.append(array if array.type == field.type else array.cast(field.type))
+    return pa.record_batch(arrays, schema=schema)
+
+
+def _schema(table, names):
+    '''Arrow schema for a table's selected columns (dates are stored as ISO text).'''
+    import pyarrow as pa
+
+    types = {int: pa.int64(), float: pa.float64(), str: pa.string(), date_type: pa.date32()}
+    return pa.schema([pa.field(n, types[_column_type(table, n)]) for n in names])
+
+
+def _column_type(table, name):
+    '''Python type of a column, taking foreign keys' types from the keys they reference.'''
+    for key in table.__table__.columns[name].foreign_keys:
+        for mapper in inspect(table).registry.mappers:
+            if mapper.local_table is key.column.table:
+                return reader.annotation(mapper.class_, key.column.name)
+    return reader.annotation(table, name)
+
+
+class _Chunks:
+    '''Write-only file that hands back whatever has been written since last asked.'''
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        '''Get and forget the bytes written so far.'''
+        data = b''.join(self.parts)
+        self.parts.clear()
+        return data
@@ -0,0 +1,78 @@
+'''Allele frequencies at SNP locations broken down by survey or site.
+
+Base counts for every (group, SNP, base) are gathered with `np.bincount`
+over the packed genomes and kept as one small integer array per grouping.
+'''
+
+import numpy as np
+
+import reader
+import similarity
+from cache import versioned
+
+# Table of SNP locations created by make_db.py.
+SNP_TABLE = 'snp'
+
+# Ways to group samples, mapped to the SQL column that names each sample's group.
+GROUPINGS = {
+    'survey': 'survey.survey_id',
+    'site': 'survey.site_id',
+}
+
+
+def frequencies(engine, by):
+    '''Get one record per (group, SNP) with sample count and base frequencies (None if no data).'''
+    found = counts(engine, by)
+    if found is None:
+        return None
+    groups, loci, references, table = found
+    bases = list(similarity.CODES)
+    records = []
+    for g, group in enumerate(groups):
+        for s, (locus, reference) in enumerate(zip(loci, references)):
+            total = int(table[g, s].sum())
+            record = {by: group, 'locus': locus, 'reference': reference, 'num_samples': total}
+            record.update(
+                {b: (int(n) / total if total else None) for (b, n) in zip(bases, table[g, s])}
+            )
+            records.append(record)
+    return records
+
+
+@versioned
+def counts(engine, by):
+    '''Get (groups, SNP loci, reference bases, counts[group, SNP, base]) (None if no data).'''
+    genomes = similarity.load(engine)
+    exists = reader.query(engine, 'SELECT 1 FROM sqlite_master WHERE name = ?', (SNP_TABLE,))
+    if (genomes is None) or (not exists):
+        return None
+    snps = reader.query(engine, f'SELECT locus, reference FROM "{SNP_TABLE}" ORDER BY locus')
+    snps = [(locus, ref) for (locus, ref) in snps if locus < genomes.length]
+    loci = [locus for (locus, _) in snps]
+    rows = reader.query(
+        engine,
+        f'SELECT sample.sample_id, {GROUPINGS[by]} FROM sample '
+        'LEFT JOIN survey ON survey.survey_id = sample.survey_id '
+        'WHERE sample.sequence IS NOT NULL ORDER BY sample.sample_id',
+    )
+    assert [r[0] for r in rows] == genomes.ids.tolist(), 'Samples changed while loading'
+
+    groups = sorted({r[1] for r in rows if r[1] is not None})
+    index = {group: i for (i, group) in enumerate(groups)}
+    labels = np.fromiter(
+        (index.get(r[1], -1) for r in rows), dtype=np.int64, count=len(rows)
+    )
+    bases = len(similarity.CODES)
+    slots = len(groups) * len(loci) * bases
+    offsets = np.arange(len(loci), dtype=np.int64) * bases
+    result = np.zeros(slots, dtype=np.int64)
+    # Samples unpacked and counted at a time (bounds temporary memory).
+    chunk_rows = similarity.unpack_rows(genomes.length)
+    for start in range(0, len(rows), chunk_rows):
+        chunk = labels[start:start + chunk_rows]
+        known = chunk >= 0
+        codes = similarity.unpack(genomes.words[start:start + chunk_rows][known], loci)
+        keys = (chunk[known, None] * (len(loci) * bases) + offsets + codes).ravel()
+        result += np.bincount(keys, minlength=slots)
+    table = result.astype(np.int32).reshape(len(groups), len(loci), bases)
+    return groups, loci, [ref for (_, ref) in snps], table
@@ -0,0 +1,86 @@
+'''Answer allele queries with the genotype bitmap index built by make_db.py.'''
+
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+import reader
+from cache import db_version, versioned
+
+# Table of compressed bitsets, one per (locus, base).
+GENOTYPE_TABLE = 'genotype'
+
+# Bases that can be queried.
+BASES = frozenset('ACGT')
+
+# Number of bitsets to keep in memory (each is one bit per sample).
+BITSET_CACHE_SIZE = 1024
+
+
+def has_index(engine):
+    '''Does the database have a genotype index?'''
+    return _sample_ids(engine) is not None
+
+
+def matching(engine, groups):
+    '''Get sample ids (ascending) matching all groups of (locus, base) alleles.
+
+    A sample matches a group if it has any of the group's alleles, so
+    `[[(3, 'A')], [(7, 'C'), (7, 'G')]]` means "A at 3 and either C or G at 7".
+    '''
+    ids = _sample_ids(engine)
+    result = None
+    for group in groups:
+        either = np.zeros(_num_bytes(len(ids)), dtype=np.uint8)
+        for locus, base in group:
+            np.bitwise_or(either, bitset(engine, locus, base), out=either)
+        result = either if result is None else np.bitwise_and(result, either, out=result)
+    if result is None:
+        return ids
+    present = np.unpackbits(result, count=len(ids), bitorder='little').astype(bool)
+    return ids[present]
+
+
+def bitset(engine, locus, base):
+    '''Get the packed bitset of samples with `base` at `locus` (all zeros if none).'''
+    version = db_version(engine)
+    if version is None:
+        return _bitset.__wrapped__(engine, version, locus, base)
+    return _bitset(engine, version, locus, base)
+
+
+@versioned
+def length(engine):
+    '''Number of loci in the genotype index.'''
+    found = reader.query(engine, f'SELECT max(locus) + 1 FROM "{GENOTYPE_TABLE}"')
+    return found[0][0] or 0
+
+
+@lru_cache(maxsize=BITSET_CACHE_SIZE)
+def _bitset(engine, version, locus, base):
+    '''Read a bitset for one version of the database (older versions age out).'''
+    found = reader.query(
+        engine,
+        f'SELECT bits FROM "{GENOTYPE_TABLE}" WHERE locus = ? AND base = ?',
+        (locus, base),
+    )
+    size = _num_bytes(len(_sample_ids(engine)))
+    if not found:
+        return np.zeros(size, dtype=np.uint8)
+    return np.frombuffer(zlib.decompress(found[0][0]), dtype=np.uint8, count=size)
+
+
+@versioned
+def _sample_ids(engine):
+    '''Sample ids in bit order (None if the database has no genotype index).'''
+    exists = reader.query(engine, 'SELECT 1 FROM sqlite_master WHERE name = ?', (GENOTYPE_TABLE,))
+    if not exists:
+        return None
+    rows = reader.query(engine, 'SELECT sample_id FROM sample ORDER BY sample_id')
+    return np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+
+
+def _num_bytes(num_bits):
+    '''Bytes needed to hold a bitset.'''
+    return (num_bits + 7) // 8
@@ -0,0 +1,56 @@
+'''Load and display plate design and readings files.'''
+
+import csv
+import os
+from functools import lru_cache
+from pathlib import Path
+
+from markupsafe import escape
+
+# Number of parsed plates to keep in memory.
+PLATE_CACHE_SIZE = 1024
+
+# Lines before the body of a plate file (instrument details and a blank line).
+HEAD_LINES = 2
+
+
+def plate_table(data_dir, filename):
+    '''Get HTML table combining a plate's design and readings (None if missing).'''
+    design = _identify(Path(data_dir, 'designs', filename))
+    readings = _identify(Path(data_dir, 'readings', filename))
+    if (design is None) or (readings is None):
+        return None
+    return _combine(design, readings)
+
+
+@lru_cache(maxsize=PLATE_CACHE_SIZE)
+def _combine(design, readings):
+    '''Render a plate; arguments include file identity so changed files are re-read.'''
+    rows = [
+        list(zip(d, r)) for (d, r) in zip(_read_body(design[0]), _read_body(readings[0]))
+    ]
+    title, *body = rows
+    lines = ['<table>', '<thead>', '<tr>']
+    lines.extend(f'<th>{escape(d)}</th>' for (d, _) in title)
+    lines.extend(['</tr>', '</thead>', '<tbody>'])
+    for (label, _), *cells in body:
+        lines.append(f'<tr><th>{escape(label)}</th>')
+        lines.extend(f'<td>{escape(d)}<br>{escape(r)}</td>' for (d, r) in cells)
+        lines.append('</tr>')
+    lines.extend(['</tbody>', '</table>'])
+    return '\n'.join(lines)
+
+
+def _identify(path):
+    '''Identify a file by path, inode, size, and modification time.'''
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (str(path), stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def _read_body(path):
+    '''Read rows of cells from a plate file, skipping its head.'''
+    with open(path, 'r', newline='') as reader:
+        return list(csv.reader(reader))[HEAD_LINES:]
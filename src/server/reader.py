@@ -0,0 +1,143 @@
+'''Read table rows as tuples without building model objects.'''
+
+import json
+from datetime import date as date_type
+from functools import cache, lru_cache
+from types import UnionType
+from typing import Union, get_args, get_origin
+
+from sqlmodel import Date
+
+# Implicit SQLite row number (increases as rows are added).
+ROWID = 'rowid'
+
+# Comparison operators allowed in filters.
+OPERATORS = {'=', '<', '<=', '>', '>=', 'IN'}
+
+# Number of distinct statements to remember (clients choose columns and filters).
+STATEMENT_CACHE_SIZE = 1024
+
+
+@cache
+def columns(table):
+    '''Names of a table's columns in storage order.'''
+    return [c.name for c in table.__table__.columns]
+
+
+def annotation(table, name):
+    '''Python type of a column's field (unwrapping optional types).'''
+    result = table.model_fields[name].annotation
+    if get_origin(result) in (Union, UnionType):
+        result = next(a for a in get_args(result) if a is not type(None))
+    return result
+
+
+@cache
+def encoders(table):
+    '''Functions that make values JSON-ready, keyed by column name.'''
+    return {
+        c.name: _encode_date for c in table.__table__.columns if isinstance(c.type, Date)
+    }
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def statement(table, names, conditions, paged, limited, order=None):
+    '''SQL to select columns in key order with filters and optional bounds.
+
+    `conditions` is a tuple of (column, operator); each takes one parameter
+    (a JSON array of values for 'IN'); `order` is the column to sort and
+    page by (default the primary key).
+    '''
+    known = {*columns(table), ROWID}
+    assert known.issuperset(names), f'Unknown columns in {names}'
+    assert known.issuperset(c for (c, _) in conditions), f'Unknown columns in {conditions}'
+    key = order or _key_name(table)
+    assert key in known, f'Unknown order column {key}'
+    selected = ', '.join(f'"{c}"' for c in names)
+    clauses = [_clause(column, op) for (column, op) in conditions]
+    if paged:
+        clauses.append(f'"{key}" > ?')
+    sql = f'SELECT {selected} FROM "{table.__tablename__}"'
+    if clauses:
+        sql += f' WHERE {" AND ".join(clauses)}'
+    sql += f' ORDER BY "{key}"'
+    if limited:
+        sql += ' LIMIT ?'
+    return sql
+
+
+def fetch(engine, table, after=None, limit=None, names=None, filters=(), order=None):
+    '''Get rows as tuples.'''
+    batches = iterate(engine, table, after, limit, names=names, filters=filters, order=order)
+    return [row for batch in batches for row in batch]
+
+
+def iterate(
+    engine, table, after=None, limit=None, batch_size=1000, names=None, filters=(), order=None
+):
+    '''Generate lists of rows from a database cursor.
+
+    `filters` is a list of (column, operator, value) with a list of values
+    for the 'IN' operator; `after` is compared with the `order` column.
+    '''
+    names = tuple(names or columns(table))
+    conditions = tuple((column, op) for (column, op, _) in filters)
+    sql = statement(table, names, conditions, after is not None, limit is not None, order)
+    params = [json.dumps(value) if op == 'IN' else value for (_, op, value) in filters]
+    params.extend(p for p in (after, limit) if p is not None)
+    con = engine.raw_connection()
+    try:
+        cursor = con.cursor()
+        cursor.execute(sql, params)
+        while batch := cursor.fetchmany(batch_size):
+            yield batch
+        cursor.close()
+    finally:
+        con.close()
+
+
+def query(engine, sql, params=()):
+    '''Run a query on a pooled connection and get all of its rows.'''
+    con = engine.raw_connection()
+    try:
+        cursor = con.cursor()
+        rows = cursor.execute(sql, params).fetchall()
+        cursor.close()
+    finally:
+        con.close()
+    return rows
+
+
+def to_records(table, rows, names=None):
+    '''Convert rows to JSON-ready dictionaries (ignoring extra trailing values).'''
+    names = names or columns(table)
+    converters = [encoders(table).get(n) for n in names]
+    if not any(converters):
+        return [dict(zip(names, row)) for row in rows]
+    return [
+        {n: (f(v) if f else v) for (n, f, v) in zip(names, converters, row)}
+        for row in rows
+    ]
+
+
+def to_ndjson(table, rows, names=None):
+    '''Convert rows to newline-delimited JSON text.'''
+    return ''.join(f'{json.dumps(r)}\n' for r in to_records(table, rows, names))
+
+
+def _clause(column, op):
+    '''Make one SQL condition (the values for 'IN' are bound as one JSON array).'''
+    assert op in OPERATORS, f'Unknown operator {op}'
+    if op == 'IN':
+        return f'"{column}" IN (SELECT value FROM json_each(?))'
+    return f'"{column}" {op} ?'
+
+
+def _encode_date(value):
+    '''Dates are stored as ISO text but may come back as date objects.'''
+    return value.isoformat() if isinstance(value, date_type) else value
+
+
+def _key_name(table):
+    '''Name of a table's primary key column.'''
+    return table.__table__.primary_key.columns.values()[0].name
@@ -1,110 +1,749 @@
 '''Serve experimental data.'''
 
-from flask import Flask, render_template, request
-from sqlmodel import Session, SQLModel, create_engine, func, select
-import sys
+import argparse
+import gzip
+import hashlib
+import math
+from datetime import UTC, datetime
+from datetime import date as date_type
+from pathlib import Path
+from urllib.parse import urlencode
 
-from models import Site, Survey, Sample, Staff, Experiment, Performed, Plate, Invalidated
+from flask import (
+    Blueprint,
+    Flask,
+    Response,
+    abort,
+    current_app,
+    g,
+    render_template,
+    request,
+    url_for,
+)
+from sqlalchemy.orm import joinedload, selectinload
+from sqlmodel import Session, func, select
 
+import association
+import export
+import frequencies
+import genotype
+import reader
+import similarity
+import spatial
+import stats
+from cache import DISK_BYTES, ResponseCache, db_version, versioned
+from db import POOL_SIZE, make_engine, prepare_db
+from models import (
+    Experiment,
+    Invalidated,
+    Performed,
+    Plate,
+    Sample,
+    Site,
+    Staff,
+    Survey,
+)
+from plates import plate_table
 
 SITE_TITLE = 'Lab Data'
-ENGINE = None
+LOAD_TABLE = 'loads'
+CACHE_BYTES = 64 * 1024 * 1024
+CACHED_HEADERS = {'Content-Type', 'Link'}
 FORMAT = 'fmt'
+NDJSON = 'ndjson'
+AFTER = 'after'
+SINCE = 'since'
+LOAD = 'load'
+LIMIT = 'limit'
+COLUMNS = 'columns'
+ALLELE = 'allele'
+RESERVED_ARGS = {FORMAT, AFTER, SINCE, LOAD, LIMIT, COLUMNS}
+FILTERS = {'': '=', 'lt': '<', 'le': '<=', 'gt': '>', 'ge': '>=', 'in': 'IN'}
+PAGE_SIZE = 1000
+NUM_SIMILAR = 10
+MAX_PAGE_SIZE = 10000
+STREAM_BATCH_SIZE = 1000
+TABLES = {
+    t.__tablename__: t
+    for t in (Site, Survey, Sample, Staff, Experiment, Performed, Plate, Invalidated)
+}
+COUNTS = {
+    'num_sites': Site,
+    'num_surveys': Survey,
+    'num_samples': Sample,
+    'num_staff': Staff,
+    'num_experiments': Experiment,
+    'num_performed': Performed,
+    'num_plates': Plate,
+    'num_invalidated': Invalidated,
+}
 
-app = Flask(__name__)
+bp = Blueprint('data', __name__)
 
-@app.route('/')
+
+def create_app(
+    dbfile,
+    cache_bytes=CACHE_BYTES,
+    cache_dir=None,
+    cache_dir_bytes=DISK_BYTES,
+    data_dir=None,
+    immutable=False,
+    threads=POOL_SIZE,
+    similarity_threads=similarity.THREADS,
+):
+    '''Create a server with its own read-only database engine.
+
+    The database must already be prepared (see `db.prepare_db`), since
+    this runs in every worker process.
+    '''
+    similarity.set_threads(similarity_threads)
+    app = Flask(__name__)
+    app.config['ENGINE'] = make_engine(dbfile, pool_size=threads, immutable=immutable)
+    app.config['DATA_DIR'] = data_dir or Path(dbfile).parent
+    app.config['RESPONSES'] = ResponseCache(cache_bytes, cache_dir, cache_dir_bytes) if cache_bytes else None
+    app.register_blueprint(bp)
+    return app
+
+
+@bp.before_request
+def _not_modified():
+    '''Answer conditional requests without querying or rendering.'''
+    key = _request_key()
+    if key is None:
+        return None
+    g.etag = hashlib.sha256(key.encode('utf-8')).hexdigest()
+    g.last_modified = datetime.fromtimestamp(
+        max(mtime for (mtime, _) in g.db_version) // 10**9, tz=UTC
+    )
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(g.etag)
+    else:
+        fresh = (request.if_modified_since is not None) and (
+            g.last_modified <= request.if_modified_since
+        )
+    return Response(status=304) if fresh else None
+
+
+@bp.after_request
+def _add_validators(response):
+    '''Label data responses with their ETag and modification time.'''
+    if ('etag' in g) and (response.status_code in (200, 304)):
+        response.set_etag(g.etag, weak=True)
+        response.last_modified = g.last_modified
+    return response
+
+
+@bp.before_request
+def _cached_response():
+    '''Serve a cached copy of the response if there is one.'''
+    responses = current_app.config['RESPONSES']
+    if responses is None:
+        return None
+    key = _request_key()
+    if key is None:
+        return None
+    entry = responses.get(key)
+    if entry is None:
+        g.cache_key = key
+        return None
+    return _from_cache(entry)
+
+
+@bp.after_request
+def _cache_response(response):
+    '''Save successful rendered responses for reuse.'''
+    key = g.pop('cache_key', None)
+    if (key is None) or (response.status_code != 200) or response.is_streamed:
+        return response
+    headers = [(k, v) for (k, v) in response.headers.items() if k in CACHED_HEADERS]
+    entry = current_app.config['RESPONSES'].put(key, response.status_code, headers, response.get_data())
+    return _from_cache(entry)
+
+
+@bp.route('/')
 def index():
     '''Display data server home page.'''
-    with Session(ENGINE) as session:
-        page_data = {
-            'site_title': SITE_TITLE,
-            'num_sites': _db_count(session, Site),
-            'num_surveys': _db_count(session, Survey),
-            'num_samples': _db_count(session, Sample),
-            'num_staff': _db_count(session, Staff),
-            'num_experiments': _db_count(session, Experiment),
-            'num_performed': _db_count(session, Performed),
-            'num_plates': _db_count(session, Plate),
-            'num_invalidated': _db_count(session, Invalidated),
-        }
-        return render_template('index.html', **page_data)
+    page_data = {
+        'site_title': SITE_TITLE,
+        **_db_counts(current_app.config['ENGINE']),
+    }
+    return render_template('index.html', **page_data)
 
 
-@app.route('/sites/')
+@bp.route('/sites/')
 def sites_index():
     '''Display site details.'''
     return _details(Site, request.args.get(FORMAT))
 
 
-@app.route('/surveys/')
+@bp.route('/surveys/')
 def surveys_index():
     '''Display site details.'''
     return _details(Survey, request.args.get(FORMAT))
 
 
-@app.route('/samples/')
+@bp.route('/samples/')
 def samples_index():
     '''Display site details.'''
     return _details(Sample, request.args.get(FORMAT))
 
 
-@app.route('/staff/')
+@bp.route('/samples/bbox')
+def samples_in_box():
+    '''Display samples inside a bounding box.'''
+    limit = min(_get_arg(LIMIT, int, PAGE_SIZE), MAX_PAGE_SIZE)
+    records = spatial.in_box(
+        current_app.config['ENGINE'],
+        _require_arg('west', _finite),
+        _require_arg('south', _finite),
+        _require_arg('east', _finite),
+        _require_arg('north', _finite),
+        limit,
+    )
+    return _records(Sample.__name__, reader.columns(Sample), records)
+
+
+@bp.route('/samples/near')
+def samples_near():
+    '''Display samples within a radius (meters) of a point, nearest first.'''
+    limit = min(_get_arg(LIMIT, int, PAGE_SIZE), MAX_PAGE_SIZE)
+    radius = _require_arg('radius', _finite)
+    if radius < 0:
+        abort(400)
+    records = spatial.near(
+        current_app.config['ENGINE'],
+        _require_arg('lon', _finite),
+        _require_arg('lat', _finite),
+        radius,
+        limit,
+    )
+    return _records(Sample.__name__, [*reader.columns(Sample), 'distance'], records)
+
+
+@bp.route('/samples/genotype')
+def samples_with_alleles():
+    '''Display ids of samples with alleles given as `allele=locus:base[,locus:base...]`.
+
+    Alleles in one parameter are alternatives; separate parameters must all match.
+    '''
+    engine = current_app.config['ENGINE']
+    if not genotype.has_index(engine):
+        abort(404)
+    length = genotype.length(engine)
+    groups = [_get_alleles(arg, length) for arg in request.args.getlist(ALLELE)]
+    if not groups:
+        abort(400)
+    after = _get_arg(AFTER, int)
+    limit = min(_get_arg(LIMIT, int, PAGE_SIZE), MAX_PAGE_SIZE)
+    if limit < 1:
+        abort(400)
+    ids = genotype.matching(engine, groups)
+    count = len(ids)
+    if after is not None:
+        ids = ids[ids > after]
+    next_url = None
+    if len(ids) > limit:
+        ids = ids[:limit]
+        args = request.args.to_dict(flat=False)
+        args.update({AFTER: int(ids[-1]), LIMIT: limit})
+        next_url = url_for(request.endpoint, **args)
+    ids = ids.tolist()
+
+    if request.args.get(FORMAT) == 'json':
+        headers = {'Link': f'<{next_url}>; rel="next"'} if next_url else {}
+        return {'count': count, 'sample_ids': ids}, headers
+
+    page_data = {
+        'site_title': SITE_TITLE,
+        'page_title': f'Samples with alleles ({count})',
+        'columns': ['sample_id'],
+        'rows': [[i] for i in ids],
+        'next_url': next_url,
+    }
+    return render_template('details.html', **page_data)
+
+
+@bp.route('/samples/similar')
+def similar_samples():
+    '''Display the `k` samples closest in Hamming distance to a `sample_id` or `sequence`.'''
+    genomes = similarity.load(current_app.config['ENGINE'])
+    if genomes is None:
+        abort(404)
+    k = min(_get_arg('k', int, NUM_SIMILAR), MAX_PAGE_SIZE)
+    sample_id = _get_arg('sample_id', int)
+    sequence = request.args.get('sequence')
+    if (k < 1) or ((sample_id is None) == (sequence is None)):
+        abort(400)
+    if sample_id is not None:
+        query = genomes.row(sample_id)
+        if query is None:
+            abort(404)
+    else:
+        if len(sequence) != genomes.length:
+            abort(400)
+        query = _convert(genomes.pack, sequence)
+    found = similarity.nearest(genomes, query, k, exclude=sample_id)
+    records = [{'sample_id': i, 'distance': d} for (i, d) in found]
+    return _records('Similar samples', ['sample_id', 'distance'], records)
+
+
+@bp.route('/staff/')
 def staff_index():
     '''Display site details.'''
     return _details(Staff, request.args.get(FORMAT))
 
 
-@app.route('/experiment/')
+@bp.route('/experiment/')
 def experiment_index():
     '''Display site details.'''
     return _details(Experiment, request.args.get(FORMAT))
 
 
-@app.route('/performed/')
+@bp.route('/performed/')
 def performed_index():
     '''Display site details.'''
     return _details(Performed, request.args.get(FORMAT))
 
 
-@app.route('/plate/')
+@bp.route('/plate/')
 def plate_index():
     '''Display site details.'''
     return _details(Plate, request.args.get(FORMAT))
 
 
-@app.route('/invalidated/')
+@bp.route('/plate/<int:plate_id>')
+def plate_details(plate_id):
+    '''Display a plate's design and readings.'''
+    with Session(current_app.config['ENGINE']) as session:
+        plate = session.get(Plate, plate_id)
+    filename = plate.filename if plate else None
+    table = plate_table(current_app.config['DATA_DIR'], filename) if filename else None
+    page_data = {
+        'site_title': SITE_TITLE,
+        'page_title': f'Plate {plate_id}',
+        'plate_id': plate_id,
+        'filename': filename,
+        'found': table is not None,
+        'table': table,
+    }
+    return render_template('plate.html', **page_data), 200 if plate else 404
+
+
+@bp.route('/experiment/<int:sample_id>')
+def experiment_details(sample_id):
+    '''Display an experiment with its plates, invalidations, and staff.'''
+    query = select(Experiment).where(Experiment.sample_id == sample_id).options(
+        selectinload(Experiment.plates).selectinload(Plate.invalidated),
+        selectinload(Experiment.performed).joinedload(Performed.staff),
+    )
+    with Session(current_app.config['ENGINE']) as session:
+        experiment = session.exec(query).one_or_none()
+        if experiment is None:
+            abort(404)
+        related = {
+            'plates': [_record(p) for p in experiment.plates],
+            'invalidated': [_record(i) for p in experiment.plates for i in p.invalidated],
+            'staff': [_record(p.staff) for p in experiment.performed],
+        }
+        return _entity(f'Experiment {sample_id}', _record(experiment), related)
+
+
+@bp.route('/survey/<int:survey_id>')
+def survey_details(survey_id):
+    '''Display a survey with its site and samples.'''
+    query = select(Survey).where(Survey.survey_id == survey_id).options(
+        joinedload(Survey.site),
+        selectinload(Survey.samples),
+    )
+    with Session(current_app.config['ENGINE']) as session:
+        survey = session.exec(query).one_or_none()
+        if survey is None:
+            abort(404)
+        related = {
+            'site': [_record(survey.site)] if survey.site else [],
+            'samples': [_record(s) for s in survey.samples],
+        }
+        return _entity(f'Survey {survey_id}', _record(survey), related)
+
+
+@bp.route('/invalidated/')
 def invalidated_index():
     '''Display site details.'''
     return _details(Invalidated, request.args.get(FORMAT))
 
 
-def _db_count(session, table):
-    '''Count rows in table.'''
-    return session.exec(select(func.count()).select_from(table)).one()
+@bp.route('/stats/<name>')
+def statistics(name):
+    '''Display grouped statistics computed by the database.'''
+    if name not in stats.QUERIES:
+        abort(404)
+    columns, rows = stats.statistics(current_app.config['ENGINE'], name)
+    if request.args.get(FORMAT) == 'json':
+        return [dict(zip(columns, row)) for row in rows]
+    page_data = {
+        'site_title': SITE_TITLE,
+        'page_title': f'Statistics: {name}',
+        'columns': columns,
+        'rows': rows,
+        'next_url': None,
+    }
+    return render_template('details.html', **page_data)
+
+
+@bp.route('/analysis/association')
+def association_scan():
+    '''Display alleles ranked by the strength of their association with readings.'''
+    results = association.scan(current_app.config['ENGINE'])
+    if results is None:
+        abort(404)
+    limit = min(_get_arg(LIMIT, int, PAGE_SIZE), MAX_PAGE_SIZE)
+    if limit < 1:
+        abort(400)
+    return _records('Association scan', list(association.FIELDS), results[:limit])
+
+
+@bp.route('/analysis/frequencies')
+def allele_frequencies():
+    '''Display allele frequencies at SNP locations by survey (default) or site.'''
+    by = request.args.get('by', 'survey')
+    if by not in frequencies.GROUPINGS:
+        abort(400)
+    records = frequencies.frequencies(current_app.config['ENGINE'], by)
+    if records is None:
+        abort(404)
+    columns = [by, 'locus', 'reference', 'num_samples', *similarity.CODES]
+    return _records(f'Allele frequencies by {by}', columns, records)
+
+
+@bp.route('/export/<name>')
+def export_table(name):
+    '''Export a whole table (optionally filtered) as Arrow IPC, Parquet, or CSV.'''
+    table = TABLES.get(name)
+    if table is None:
+        abort(404)
+    fmt = request.args.get(FORMAT, 'arrow')
+    if fmt not in export.FORMATS:
+        abort(400)
+    if not export.available(fmt):
+        abort(501)
+    chunks = export.export(
+        current_app.config['ENGINE'], table, fmt, _get_columns(table), _get_filters(table)
+    )
+    headers = {'Content-Disposition': f'attachment; filename="{name}.{fmt}"'}
+    return Response(chunks, mimetype=export.FORMATS[fmt], headers=headers)
+
+
+@bp.route('/changes/')
+def high_water_marks():
+    '''Report the current load id and each table's highest rowid and row count.
+
+    A mirror saves these, later asks each table route for `since=<rowid>`
+    and `load=<load id>` to get the rows added or changed since then, and
+    starts again if the server answers 409 (its load is not in this
+    database's history). Rebuilds keep unchanged rows' rowids, but deleted
+    rows are not reported: a mirror whose row count differs from `rows`
+    after syncing should re-pull that table.
+    '''
+    return _high_water_marks(current_app.config['ENGINE'])
+
+
+@versioned
+def _high_water_marks(engine):
+    '''Get the current load and the highest rowid and number of rows in each table.'''
+    query = ' UNION ALL '.join(
+        f"SELECT '{name}', max(rowid), count(*) FROM \"{name}\"" for name in TABLES
+    )
+    found = reader.query(engine, query)
+    return {
+        **_load(engine),
+        'tables': {name: mark or 0 for (name, mark, _) in found},
+        'rows': {name: count for (name, _, count) in found},
+    }
+
+
+@versioned
+def _load(engine):
+    '''Get the id and time of the latest load (None if not recorded).'''
+    history = _load_history(engine)
+    load_id, loaded = history[-1] if history else (None, None)
+    return {'load': load_id, 'loaded': loaded}
+
+
+@versioned
+def _load_history(engine):
+    '''Get (load id, time) of every load into this database file, oldest first.'''
+    names = reader.query(engine, 'SELECT name FROM pragma_table_info(?)', (LOAD_TABLE,))
+    if ('load_id',) not in names:
+        return []
+    return reader.query(engine, f'SELECT load_id, loaded FROM "{LOAD_TABLE}" ORDER BY version')
+
+
+@versioned
+def _db_counts(engine):
+    '''Count rows in all tables in a single query.'''
+    query = select(
+        *[select(func.count()).select_from(t).scalar_subquery() for t in COUNTS.values()]
+    )
+    with Session(engine) as session:
+        values = session.exec(query).one()
+    return dict(zip(COUNTS.keys(), values))
 
 
 def _details(table, fmt):
-    '''Show details of table.'''
-    with Session(ENGINE) as session:
-        columns = list(table.__fields__.keys())
-        records = list(session.exec(select(table)).all())
-
-        if fmt and (fmt == 'json'):
-            return [r.model_dump() for r in records]
-
-        rows = [[getattr(r, c) for c in columns] for r in records]
-        page_data = {
-            'site_title': SITE_TITLE,
-            'page_title': table.__name__,
-            'columns': columns,
-            'rows': rows,
-        }
-        return render_template('details.html', **page_data)
+    '''Show one page of details of table.
+
+    `since=rowid` (with `load=<load id>`) pages through rows added or
+    changed after a mirror's high-water mark (in rowid order) instead of
+    paging by primary key with `after`.
+    '''
+    if SINCE in request.args:
+        if AFTER in request.args:
+            abort(400)
+        _check_load()
+        order, marker = reader.ROWID, SINCE
+        after = _get_arg(SINCE, int)
+    else:
+        order, marker = _primary_key(table).name, AFTER
+        after = _get_arg(AFTER, _field_type(table, order))
+    limit = min(_get_arg(LIMIT, int, PAGE_SIZE), MAX_PAGE_SIZE)
+    if limit < 1:
+        abort(400)
+    columns = _get_columns(table)
+    filters = _get_filters(table)
+    selected = columns if order in columns else [*columns, order]
+
+    if fmt == NDJSON:
+        limit = limit if LIMIT in request.args else None
+        return _stream(table, after, limit, columns, filters, order)
+
+    rows = reader.fetch(
+        current_app.config['ENGINE'],
+        table,
+        after,
+        limit + 1,
+        names=selected,
+        filters=filters,
+        order=order,
+    )
+
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        args = request.args.to_dict(flat=False)
+        args.update({marker: rows[-1][selected.index(order)], LIMIT: limit})
+        next_url = url_for(request.endpoint, **args)
+
+    if fmt and (fmt == 'json'):
+        headers = {'Link': f'<{next_url}>; rel="next"'} if next_url else {}
+        return reader.to_records(table, rows, columns), headers
+
+    page_data = {
+        'site_title': SITE_TITLE,
+        'page_title': table.__name__,
+        'columns': columns,
+        'rows': [row[:len(columns)] for row in rows],
+        'next_url': next_url,
+    }
+    return render_template('details.html', **page_data)
+
+
+def _entity(title, record, related):
+    '''Show one entity and tables of its related rows.'''
+    if request.args.get(FORMAT) == 'json':
+        return {**record, **related}
+    page_data = {
+        'site_title': SITE_TITLE,
+        'page_title': title,
+        'record': record,
+        'related': related,
+    }
+    return render_template('entity.html', **page_data)
+
+
+def _records(title, columns, records):
+    '''Show a list of records as JSON or an HTML table.'''
+    if request.args.get(FORMAT) == 'json':
+        return records
+    page_data = {
+        'site_title': SITE_TITLE,
+        'page_title': title,
+        'columns': columns,
+        'rows': [[r[c] for c in columns] for r in records],
+        'next_url': None,
+    }
+    return render_template('details.html', **page_data)
+
+
+def _record(obj):
+    '''Convert a model object to a JSON-ready dictionary.'''
+    table = type(obj)
+    return reader.to_records(table, [[getattr(obj, c) for c in reader.columns(table)]])[0]
+
+
+def _get_columns(table):
+    '''Get the requested columns (default all), failing on unknown or repeated names.'''
+    known = reader.columns(table)
+    if COLUMNS not in request.args:
+        return known
+    columns = request.args[COLUMNS].split(',')
+    if (not set(columns).issubset(known)) or (len(set(columns)) != len(columns)):
+        abort(400)
+    return columns
+
+
+def _get_filters(table):
+    '''Get (column, operator, value) filters from query parameters.
+
+    `name=value` tests equality; `name__lt`, `name__le`, `name__gt`, and
+    `name__ge` compare; `name__in=a,b,c` tests membership.
+    '''
+    known = reader.columns(table)
+    filters = []
+    for arg, values in request.args.lists():
+        if arg in RESERVED_ARGS:
+            continue
+        name, _, suffix = arg.partition('__')
+        if (name not in known) or (suffix not in FILTERS):
+            abort(400)
+        convert = _field_type(table, name)
+        for value in values:
+            if suffix == 'in':
+                filters.append((name, 'IN', [_convert(convert, v) for v in value.split(',')]))
+            else:
+                filters.append((name, FILTERS[suffix], _convert(convert, value)))
+    return filters
+
+
+def _get_alleles(text, length):
+    '''Parse `locus:base[,locus:base...]` into (locus, base) pairs, failing on bad values.
+
+    Loci must be in [0, length) and bases must be one of A, C, G, or T.
+    '''
+    alleles = []
+    for term in text.split(','):
+        locus, sep, base = term.partition(':')
+        locus, base = _convert(int, locus), base.upper()
+        if (not sep) or (base not in genotype.BASES) or not (0 <= locus < length):
+            abort(400)
+        alleles.append((locus, base))
+    return alleles
+
+
+def _field_type(table, name):
+    '''Get a function that converts query text to a field's type.'''
+    annotation = reader.annotation(table, name)
+    if annotation is date_type:
+        return lambda text: date_type.fromisoformat(text).isoformat()
+    return annotation
+
+
+def _request_key():
+    '''Identify a data request by route, arguments, and database version.'''
+    if 'request_key' not in g:
+        g.db_version = db_version(current_app.config['ENGINE'])
+        if (request.method != 'GET') or (g.db_version is None):
+            g.request_key = None
+        else:
+            args = urlencode(sorted(request.args.items(multi=True)))
+            g.request_key = f'{g.db_version}|{request.path}?{args}'
+    return g.request_key
+
+
+def _from_cache(entry):
+    '''Make a response from a cache entry, compressed if the client allows.'''
+    status, headers, body = entry
+    response = Response(status=status, headers=headers)
+    response.vary.add('Accept-Encoding')
+    if request.accept_encodings['gzip'] > 0:
+        response.set_data(body)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response.set_data(gzip.decompress(body))
+    return response
+
+
+def _stream(table, after, limit, names, filters, order=None):
+    '''Stream rows as newline-delimited JSON in batches.'''
+    engine = current_app.config['ENGINE']
+    batches = reader.iterate(
+        engine, table, after, limit, STREAM_BATCH_SIZE, names=names, filters=filters, order=order
+    )
+
+    def _generate():
+        for batch in batches:
+            yield reader.to_ndjson(table, batch, names)
+    return Response(_generate(), mimetype='application/x-ndjson')
+
+
+def _check_load():
+    '''Fail with 409 if a mirror's load is not in this database's history (its rowids mean nothing here).'''
+    load = _require_arg(LOAD, str)
+    if load not in {load_id for (load_id, _) in _load_history(current_app.config['ENGINE'])}:
+        abort(409)
+
+
+def _get_arg(name, convert, default=None):
+    '''Get and convert a query parameter, failing on bad values.'''
+    value = request.args.get(name)
+    if value is None:
+        return default
+    return _convert(convert, value)
+
+
+def _require_arg(name, convert):
+    '''Get and convert a required query parameter.'''
+    value = _get_arg(name, convert)
+    if value is None:
+        abort(400)
+    return value
+
+
+def _convert(convert, value):
+    '''Convert query text, failing on bad values.'''
+    try:
+        return convert(value)
+    except ValueError:
+        abort(400)
+
+
+def _finite(text):
+    '''Convert query text to a float, rejecting nan and infinities.'''
+    value = float(text)
+    if not math.isfinite(value):
+        raise ValueError(f'not a finite number: {text}')
+    return value
+
+
+def _primary_key(table):
+    '''Get the primary key column of a table.'''
+    return table.__table__.primary_key.columns.values()[0]
+
+
+def parse_args():
+    '''Parse command-line arguments.'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cache-bytes', type=int, default=CACHE_BYTES, help='in-memory response cache size')
+    parser.add_argument('--cache-dir', type=str, default=None, help='shared on-disk response cache')
+    parser.add_argument('--cache-dir-bytes', type=int, default=DISK_BYTES, help='on-disk response cache size')
+    parser.add_argument('--data-dir', type=str, default=None, help='plate files directory (default: database directory)')
+    parser.add_argument('--immutable', action='store_true', help='database will not change while serving')
+    parser.add_argument('--similarity-threads', type=int, default=similarity.THREADS, help='threads shared by similarity searches')
+    parser.add_argument('--threads', type=int, default=POOL_SIZE, help='serving threads and pooled connections')
+    parser.add_argument('dbfile', type=str, help='database file')
+    return parser.parse_args()
 
 
 if __name__ == '__main__':
-    dbfile = sys.argv[1]
-    ENGINE = create_engine(f'sqlite:///{dbfile}')
-    SQLModel.metadata.create_all(ENGINE)
-    app.run()
+    options = parse_args()
+    prepare_db(options.dbfile)
+    app = create_app(
+        options.dbfile,
+        cache_bytes=options.cache_bytes,
+        cache_dir=options.cache_dir,
+        cache_dir_bytes=options.cache_dir_bytes,
+        data_dir=options.data_dir,
+        immutable=options.immutable,
+        threads=options.threads,
+        similarity_threads=options.similarity_threads,
+    )
+    app.run(threaded=options.threads > 1)
@@ -0,0 +1,161 @@
+'''Find the samples whose genomes are closest to a query in Hamming distance.
+
+Sequences are packed two bits per base into 64-bit words, so comparing a
+query with every sample is an XOR, a mask that turns each differing base
+into one set bit, and a popcount, all vectorized across the population.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import reader
+from cache import versioned
+
+# Two-bit codes for bases (anything else is rejected).
+CODES = {'A': 0, 'C': 1, 'G': 2, 'T': 3}
+
+# Lookup value for characters that are not bases.
+NOT_A_BASE = 255
+
+# Bases per packed 64-bit word.
+BASES_PER_WORD = 32
+
+# Low bit of every two-bit base in a word.
+LOW_BITS = np.uint64(0x5555555555555555)
+
+# Shift that brings each base in a word down to the lowest two bits.
+SHIFTS = np.arange(0, 64, 2, dtype=np.uint64)
+
+# Bytes of 64-bit values per unpacked chunk (callers may hold a few such arrays).
+CHUNK_BYTES = 64 * 1024 * 1024
+
+# Rows compared per task when spreading work across threads.
+CHUNK_ROWS = 256 * 1024
+
+# Default number of comparison threads shared by all requests (1 compares serially).
+THREADS = 1
+
+# Shared comparison pool (None when comparing serially); see set_threads.
+_pool = None
+
+
+class Genomes:
+    '''Sample ids and their sequences packed two bits per base.'''
+
+    def __init__(self, ids, words, length):
+        self.ids = ids
+        self.words = words
+        self.length = length
+
+    def pack(self, sequence):
+        '''Pack one sequence into a row of words (ValueError if it is not all ACGT).'''
+        return pack([sequence], self.length)[0]
+
+    def row(self, sample_id):
+        '''Get the packed row for a sample (None if unknown).'''
+        i = np.searchsorted(self.ids, sample_id)
+        if (i == len(self.ids)) or (self.ids[i] != sample_id):
+            return None
+        return self.words[i]
+
+
+def nearest(genomes, query, k, exclude=None):
+    '''Get (sample_id, distance) pairs for the `k` samples closest to a packed query.
+
+    Ties are broken by sample_id; `exclude` is a sample id to leave out.
+    '''
+    distances = hamming(genomes.words, query)
+    if exclude is not None:
+        distances[genomes.ids == exclude] = np.iinfo(distances.dtype).max
+        k = min(k, len(distances) - 1)
+    k = min(k, len(distances))
+    if k <= 0:
+        return []
+    # Keep everything tied with the k'th distance so ties are broken by id.
+    cutoff = np.partition(distances, k - 1)[k - 1]
+    candidates = np.flatnonzero(distances <= cutoff)
+    order = np.lexsort((genomes.ids[candidates], distances[candidates]))
+    chosen = candidates[order[:k]]
+    return list(zip(genomes.ids[chosen].tolist(), distances[chosen].tolist()))
+
+
+def hamming(words, query):
+    '''Count differing bases between every row of packed words and a packed query.'''
+    distances = np.empty(len(words), dtype=np.int64)
+    starts = range(0, len(words), CHUNK_ROWS)
+
+    def _chunk(start):
+        block = np.bitwise_xor(words[start:start + CHUNK_ROWS], query)
+        block |= block >> np.uint64(1)
+        block &= LOW_BITS
+        distances[start:start + CHUNK_ROWS] = np.bitwise_count(block).sum(axis=1, dtype=np.int64)
+
+    pool = _pool
+    if (pool is not None) and (len(starts) > 1):
+        list(pool.map(_chunk, starts))
+    else:
+        for start in starts:
+            _chunk(start)
+    return distances
+
+
+def pack(sequences, length):
+    '''Pack sequences into rows of 64-bit words, two bits per base.
+
+    Sequences shorter than `length` are padded with 'A'; any character other
+    than A, C, G, or T (in either case) raises ValueError.
+    '''
+    lookup = np.full(256, NOT_A_BASE, dtype=np.uint8)
+    for base, code in CODES.items():
+        lookup[ord(base)] = code
+        lookup[ord(base.lower())] = code
+    num_words = -(-length // BASES_PER_WORD)
+    width = num_words * BASES_PER_WORD
+    text = ''.join(s.ljust(width, 'A')[:width] for s in sequences).encode('ascii', 'replace')
+    codes = lookup[np.frombuffer(text, dtype=np.uint8)]
+    if (codes == NOT_A_BASE).any():
+        raise ValueError('sequences may only contain A, C, G, and T')
+    codes = codes.reshape(len(sequences), num_words, BASES_PER_WORD)
+    words = np.zeros((len(sequences), num_words), dtype=np.uint64)
+    for i in range(BASES_PER_WORD):
+        words |= codes[:, :, i].astype(np.uint64) << np.uint64(2 * i)
+    return words
+
+
+def unpack(words, loci):
+    '''Unpack rows of words into an array of base codes with one column per locus.'''
+    codes = (words[:, :, None] >> SHIFTS) & np.uint64(3)
+    return codes.astype(np.uint8).reshape(len(words), -1)[:, loci]
+
+
+def unpack_rows(length):
+    '''Number of rows to unpack at a time so that one 64-bit value per base fits in CHUNK_BYTES.'''
+    width = -(-length // BASES_PER_WORD) * BASES_PER_WORD
+    return max(1, CHUNK_BYTES // (8 * max(width, 1)))
+
+
+def set_threads(threads):
+    '''Compare chunks of samples in one pool of `threads` threads shared by all callers.'''
+    global _pool
+    previous = _pool
+    _pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='similarity') if threads > 1 else None
+    if previous is not None:
+        previous.shutdown(wait=False)
+
+
+@versioned
+def load(engine):
+    '''Get all samples' packed genomes (None if there are no sequences).'''
+    names = reader.query(engine, "SELECT name FROM pragma_table_info('sample')")
+    if ('sequence',) not in names:
+        return None
+    rows = reader.query(
+        engine, 'SELECT sample_id, sequence FROM sample WHERE sequence IS NOT NULL ORDER BY sample_id'
+    )
+    if not rows:
+        return None
+    ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    sequences = [r[1] for r in rows]
+    length = max((len(s) for s in sequences), default=0)
+    return Genomes(ids, pack(sequences, length), length)
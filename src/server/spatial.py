@@ -0,0 +1,125 @@
+'''Find samples by location.
+
+Candidates come from the R*Tree that `make_db.py` builds over sample
+locations (or from a plain range scan on older databases); exact
+coordinates are then checked so that results do not depend on the
+R*Tree's single-precision boxes. Longitudes run from -180 to 180; a box
+whose west edge is east of its east edge crosses the antimeridian and is
+searched as two boxes.
+'''
+
+import math
+
+import reader
+from cache import versioned
+from models import Sample
+
+# Mean radius of the Earth in meters.
+EARTH_RADIUS = 6_371_000.0
+
+# Name of the R*Tree table created by make_db.py.
+SPATIAL_INDEX = 'sample_location'
+
+# Longitude and latitude limits in degrees.
+MAX_LON = 180.0
+MAX_LAT = 90.0
+
+
+def in_box(engine, west, south, east, north, limit=None):
+    '''Get sample records inside a bounding box in sample_id order.
+
+    If `west` is greater than `east` the box crosses the antimeridian.
+    '''
+    return reader.to_records(Sample, _candidates(engine, _spans(west, east), south, north, limit))
+
+
+def near(engine, lon, lat, radius, limit=None):
+    '''Get sample records within `radius` meters of a point, nearest first.
+
+    Each record has an extra 'distance' field in meters.
+    '''
+    angle = min(radius / EARTH_RADIUS, math.pi)
+    dlat = math.degrees(angle)
+    if (lat + dlat >= MAX_LAT) or (lat - dlat <= -MAX_LAT):
+        # The circle holds a pole, so it spans every longitude.
+        spans = [(-MAX_LON, MAX_LON)]
+    else:
+        # Widest longitude offset of the circle from its center.
+        ratio = math.sin(angle) / math.cos(math.radians(lat))
+        dlon = math.degrees(math.asin(min(ratio, 1.0)))
+        spans = _spans(_wrap(lon - dlon), _wrap(lon + dlon))
+    rows = _candidates(engine, spans, lat - dlat, lat + dlat)
+    names = reader.columns(Sample)
+    i_lon, i_lat = names.index('lon'), names.index('lat')
+    found = []
+    for row in rows:
+        distance = haversine(lon, lat, row[i_lon], row[i_lat])
+        if distance <= radius:
+            found.append((distance, row))
+    found.sort(key=lambda pair: pair[0])
+    found = found[:limit] if limit is not None else found
+    records = reader.to_records(Sample, [row for (_, row) in found])
+    for (distance, _), record in zip(found, records):
+        record['distance'] = distance
+    return records
+
+
+def haversine(lon_a, lat_a, lon_b, lat_b):
+    '''Great-circle distance in meters between two points in degrees.'''
+    phi_a, phi_b = math.radians(lat_a), math.radians(lat_b)
+    d_phi = phi_b - phi_a
+    d_lambda = math.radians(lon_b - lon_a)
+    h = math.sin(d_phi / 2) ** 2 + math.cos(phi_a) * math.cos(phi_b) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(h)))
+
+
+@versioned
+def has_index(engine):
+    '''Does the database have a spatial index?'''
+    return bool(reader.query(engine, 'SELECT 1 FROM sqlite_master WHERE name = ?', (SPATIAL_INDEX,)))
+
+
+def _candidates(engine, spans, south, north, limit=None):
+    '''Get sample rows whose exact location is inside boxes sharing a latitude range.'''
+    south, north = max(south, -MAX_LAT), min(north, MAX_LAT)
+    rows = []
+    for west, east in spans:
+        rows.extend(_in_box(engine, west, south, east, north, limit))
+    if len(spans) > 1:
+        i_id = reader.columns(Sample).index('sample_id')
+        rows.sort(key=lambda row: row[i_id])
+    return rows[:limit] if limit is not None else rows
+
+
+def _in_box(engine, west, south, east, north, limit=None):
+    '''Get sample rows whose exact location is inside one box.'''
+    selected = ', '.join(f'sample."{c}"' for c in reader.columns(Sample))
+    exact = 'sample.lon BETWEEN ? AND ? AND sample.lat BETWEEN ? AND ?'
+    params = [west, east, south, north]
+    if has_index(engine):
+        sql = (
+            f'SELECT {selected} FROM "{SPATIAL_INDEX}" AS loc '
+            'JOIN sample ON sample.sample_id = loc.sample_id '
+            'WHERE loc.max_lon >= ? AND loc.min_lon <= ? AND loc.max_lat >= ? AND loc.min_lat <= ? '
+            f'AND {exact}'
+        )
+        params = [west, east, south, north, *params]
+    else:
+        sql = f'SELECT {selected} FROM sample WHERE {exact}'
+    sql += ' ORDER BY sample.sample_id'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    return reader.query(engine, sql, params)
+
+
+def _spans(west, east):
+    '''Split a longitude range into ranges that do not cross the antimeridian.'''
+    if west <= east:
+        return [(west, east)]
+    return [(west, MAX_LON), (-MAX_LON, east)]
+
+
+def _wrap(lon):
+    '''Bring a longitude into [-180, 180).'''
+    return ((lon + MAX_LON) % (2 * MAX_LON)) - MAX_LON
@@ -0,0 +1,87 @@
+'''Grouped lab statistics computed inside the database.'''
+
+import math
+
+import reader
+from cache import versioned
+
+# Name: (column names, SQL); readings are summarized as count, sum, and sum of squares.
+# Invalidations by staff not in the staff table have null names.
+QUERIES = {
+    'surveys': (
+        ('survey_id', 'site_id', 'date', 'num_samples', 'mean_reading', 'stddev_reading'),
+        '''
+        SELECT survey.survey_id, survey.site_id, survey.date,
+               grouped.n, grouped.total, grouped.squares
+        FROM survey LEFT JOIN (
+            SELECT survey_id, count(reading) AS n, sum(reading) AS total,
+                   sum(reading * reading) AS squares
+            FROM sample GROUP BY survey_id
+        ) AS grouped ON grouped.survey_id = survey.survey_id
+        ORDER BY survey.survey_id
+        ''',
+    ),
+    'sites': (
+        ('site_id', 'num_surveys', 'num_samples', 'mean_reading', 'stddev_reading'),
+        '''
+        SELECT site.site_id, count(DISTINCT survey.survey_id),
+               count(sample.reading), sum(sample.reading),
+               sum(sample.reading * sample.reading)
+        FROM site
+        LEFT JOIN survey ON survey.site_id = site.site_id
+        LEFT JOIN sample ON sample.survey_id = survey.survey_id
+        GROUP BY site.site_id
+        ORDER BY site.site_id
+        ''',
+    ),
+    'plates': (
+        ('date', 'num_plates'),
+        '''
+        SELECT date, count(*) FROM plate GROUP BY date ORDER BY date
+        ''',
+    ),
+    'durations': (
+        ('kind', 'num_experiments', 'num_unfinished', 'mean_days', 'min_days', 'max_days'),
+        '''
+        SELECT kind, count(*), count(*) - count("end"),
+               avg(julianday("end") - julianday(start)),
+               min(julianday("end") - julianday(start)),
+               max(julianday("end") - julianday(start))
+        FROM experiment GROUP BY kind ORDER BY kind
+        ''',
+    ),
+    'invalidations': (
+        ('staff_id', 'personal', 'family', 'num_invalidated'),
+        '''
+        SELECT invalidated.staff_id, staff.personal, staff.family, count(*)
+        FROM invalidated LEFT JOIN staff ON staff.staff_id = invalidated.staff_id
+        GROUP BY invalidated.staff_id
+        ORDER BY invalidated.staff_id
+        ''',
+    ),
+}
+
+# Statistics whose last three values are reading count, sum, and sum of squares.
+READING_SUMMARIES = {'surveys', 'sites'}
+
+
+@versioned
+def statistics(engine, name):
+    '''Get (column names, rows) for a named statistic.'''
+    names, sql = QUERIES[name]
+    rows = reader.query(engine, sql)
+    if name in READING_SUMMARIES:
+        rows = [(*row[:-3], *_summarize(*row[-3:])) for row in rows]
+    return list(names), rows
+
+
+def _summarize(n, total, squares):
+    '''Convert count, sum, and sum of squares to count, mean, and sample standard deviation.'''
+    n = n or 0
+    if n == 0:
+        return (0, None, None)
+    mean = total / n
+    if n == 1:
+        return (n, mean, None)
+    variance = max(squares - (total * total) / n, 0.0) / (n - 1)
+    return (n, mean, math.sqrt(variance))